@@ -0,0 +1,78 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect
+from django.utils.cache import patch_cache_control
+import short_url
+
+from api.autocomplete import ingredient_index
+from api.middleware import collect_queries
+from api.shortlinks import recipe_ids
+from api.views import IngredientViewSet, RecipeViewSet
+
+
+def run_sync_view(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        with collect_queries(request):
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(async_handler, sync_view):
+    async def view(request, *args, **kwargs):
+        if async_handler is not None and request.method == 'GET':
+            response = await async_handler(request, *args, **kwargs)
+            if response is not None:
+                return response
+        return await sync_to_async(run_sync_view, thread_sensitive=False)(
+            sync_view, request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+async def ingredient_autocomplete(request):
+    name = request.GET.get('name')
+    if not name or set(request.GET) != {'name'}:
+        return None
+    entries = ingredient_index.get_local_entries()
+    if entries is None:
+        entries = await sync_to_async(ingredient_index.get_entries)()
+    return JsonResponse(list(ingredient_index.prefix_items(name, entries)),
+                        safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+async def recipe_from_short_link(request, link):
+    try:
+        id = short_url.decode_url(link)
+    except ValueError:
+        raise Http404
+    if not (recipe_ids.is_fresh() and recipe_ids.contains(id)):
+        if not await sync_to_async(recipe_ids.exists)(id):
+            raise Http404
+    response = redirect(f'/recipes/{id}')
+    if settings.SHORT_LINK_CACHE_SECONDS:
+        patch_cache_control(response, public=True,
+                            max_age=settings.SHORT_LINK_CACHE_SECONDS)
+    return response
+
+
+recipe_list = async_read_view(
+    None,
+    RecipeViewSet.as_view({'get': 'list', 'post': 'create'})
+)
+recipe_detail = async_read_view(
+    None,
+    RecipeViewSet.as_view({'get': 'retrieve', 'patch': 'partial_update',
+                           'delete': 'destroy'})
+)
+ingredient_list = async_read_view(
+    ingredient_autocomplete,
+    IngredientViewSet.as_view({'get': 'list'})
+)
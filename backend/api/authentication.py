@@ -0,0 +1,107 @@
+from collections import OrderedDict
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from api.cache import bump_version, get_version, make_key
+from api.metrics import registry
+from foodgram_backend.constants import TOKEN_CACHE_SIZE
+
+
+VERSION_NAME = 'authtoken'
+
+
+class TokenCache:
+    """Токен -> (токен, пользователь) в локальном LRU с ограниченным
+    временем жизни и, если задан TOKEN_CACHE_ALIAS, в общем кэше.
+
+    Записи привязаны к версии VERSION_NAME из общего хранилища версий,
+    поэтому удаление токена в любом процессе сбрасывает их во всех
+    воркерах: в этом процессе сразу, в остальных не позже, чем через
+    VERSION_POLL_SECONDS. Версию нужно получать до чтения токена из базы,
+    чтобы удаленный в это время токен не попал в кэш с новой версией.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_shared(self):
+        if settings.TOKEN_CACHE_ALIAS:
+            return caches[settings.TOKEN_CACHE_ALIAS]
+        return None
+
+    def get_version(self):
+        return get_version(VERSION_NAME)
+
+    def make_key(self, key, version):
+        return make_key(VERSION_NAME, version, key)
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, entry_version, value = entry
+                if expires > time.monotonic() and entry_version == version:
+                    self._entries.move_to_end(key)
+                    registry.increment('foodgram_token_cache_total',
+                                       result='local_hit')
+                    return value
+                del self._entries[key]
+        shared = self.get_shared()
+        if shared is not None:
+            value = shared.get(self.make_key(key, version))
+            if value is not None:
+                self._set_local(key, value, version)
+                registry.increment('foodgram_token_cache_total',
+                                   result='shared_hit')
+                return value
+        registry.increment('foodgram_token_cache_total', result='miss')
+        return None
+
+    def _set_local(self, key, value, version):
+        with self._lock:
+            self._entries[key] = (
+                time.monotonic() + settings.TOKEN_CACHE_SECONDS, version,
+                value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def set(self, key, value, version):
+        self._set_local(key, value, version)
+        shared = self.get_shared()
+        if shared is not None:
+            shared.set(self.make_key(key, version), value,
+                       settings.TOKEN_CACHE_SECONDS)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        bump_version(VERSION_NAME)
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        version = token_cache.get_version()
+        cached = token_cache.get(key, version)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached, version)
+        user, token = cached
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        return copy.copy(user), token
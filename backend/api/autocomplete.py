@@ -0,0 +1,85 @@
+from bisect import bisect_left
+import threading
+
+from api.cache import get_local_version, get_version
+from recipes.models import Ingredient
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+
+    def __init__(self):
+        self._version = None
+        self._entries = ((), (), ())
+        self._lock = threading.Lock()
+
+    def get_local_entries(self):
+        """Записи, если версия из памяти процесса совпадает, иначе None.
+
+        Не обращается к хранилищу версий: для асинхронных представлений.
+        """
+        version = get_local_version(Ingredient._meta.label_lower)
+        if version is not None and version == self._version:
+            return self._entries
+        return None
+
+    def get_entries(self):
+        return self._get_entries()
+
+    def _get_entries(self):
+        version = get_version(Ingredient._meta.label_lower)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._entries = self._build()
+                    self._version = version
+        return self._entries
+
+    def _build(self):
+        rows = sorted(
+            (normalize(name), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit')
+        )
+        return (
+            tuple(row[0] for row in rows),
+            tuple(row[1] for row in rows),
+            tuple({'id': pk, 'name': name,
+                   'measurement_unit': measurement_unit}
+                  for _, pk, name, measurement_unit in rows),
+        )
+
+    def _range(self, keys, value):
+        return (bisect_left(keys, value),
+                bisect_left(keys, value + '\U0010ffff'))
+
+    def prefix(self, value):
+        keys, ids, _ = self._get_entries()
+        start, end = self._range(keys, normalize(value))
+        return ids[start:end]
+
+    def prefix_items(self, value, entries=None):
+        keys, _, items = (self._get_entries() if entries is None
+                          else entries)
+        start, end = self._range(keys, normalize(value))
+        return items[start:end]
+
+    def search(self, value):
+        keys, ids, _ = self._get_entries()
+        value = normalize(value)
+        start, end = self._range(keys, value)
+        exact = [pk for key, pk in zip(keys[start:end], ids[start:end])
+                 if key == value]
+        prefix = [pk for key, pk in zip(keys[start:end], ids[start:end])
+                  if key != value]
+        contains = [
+            pk for position, (key, pk) in enumerate(zip(keys, ids))
+            if value in key and not start <= position < end
+        ]
+        return exact, prefix, contains
+
+
+ingredient_index = IngredientIndex()
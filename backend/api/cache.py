@@ -0,0 +1,88 @@
+from hashlib import md5
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from recipes.models import Ingredient, Tag
+
+
+FRAGMENT_PREFIX = 'recipe-fragment'
+FRAGMENT_VERSIONS = (Ingredient._meta.label_lower, Tag._meta.label_lower)
+
+
+# Версии, прочитанные этим процессом: имя -> (срок годности, версия).
+local_versions = {}
+
+
+def get_local_versions(*names):
+    """Версии из памяти процесса или None, если их пора перечитать.
+
+    Не обращается к хранилищу версий, поэтому безопасна в асинхронном коде.
+    """
+    now = time.monotonic()
+    entries = [local_versions.get(name) for name in names]
+    if all(entry is not None and entry[0] > now for entry in entries):
+        return [entry[1] for entry in entries]
+    return None
+
+
+def get_local_version(name):
+    versions = get_local_versions(name)
+    return None if versions is None else versions[0]
+
+
+def get_versions(*names):
+    """Версии из общего хранилища, перечитываемые не чаще, чем раз
+    в VERSION_POLL_SECONDS.
+
+    Изменение версии в другом процессе становится видно с этой задержкой,
+    а в процессе, который ее изменил, сразу.
+    """
+    found = get_local_versions(*names)
+    if found is not None:
+        return found
+    versions = caches['versions']
+    keys = [f'version:{name}' for name in names]
+    found = versions.get_many(keys)
+    result = []
+    expires = time.monotonic() + settings.VERSION_POLL_SECONDS
+    for name, key in zip(names, keys):
+        version = found.get(key)
+        if version is None:
+            version = time.time()
+            if not versions.add(key, version, timeout=None):
+                version = versions.get(key, version)
+        local_versions[name] = (expires, version)
+        result.append(version)
+    return result
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def bump_version(name):
+    version = time.time()
+    caches['versions'].set(f'version:{name}', version, timeout=None)
+    local_versions[name] = (
+        time.monotonic() + settings.VERSION_POLL_SECONDS, version)
+
+
+def make_key(prefix, version, *parts):
+    digest = md5(':'.join(map(str, parts)).encode()).hexdigest()
+    return f'{prefix}:{version}:{digest}'
+
+
+def fragment_keys(recipes):
+    """Ключи фрагментов с версиями справочников, рецепта и его автора.
+
+    Изменение рецепта или автора меняет ключ, поэтому фрагмент, записанный
+    параллельным запросом по старым данным, больше не будет прочитан.
+    """
+    version = ':'.join(map(str, get_versions(*FRAGMENT_VERSIONS)))
+    return {
+        recipe.pk: make_key(FRAGMENT_PREFIX, version, recipe.pk,
+                            recipe.updated_at, recipe.author_updated_at)
+        for recipe in recipes
+    }
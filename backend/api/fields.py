@@ -1,13 +1,71 @@
 import base64
+import binascii
 
-from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from rest_framework import serializers
 
+from foodgram_backend.constants import BASE64_CHUNK_SIZE
+
+
+def decode_base64_file(data, name, content_type):
+    # Части фиксированной длины декодируются корректно, только если в
+    # строке нет переносов, которые допускает b64decode.
+    data = ''.join(data.split())
+    file = TemporaryUploadedFile(name, content_type, 0, None)
+    for start in range(0, len(data), BASE64_CHUNK_SIZE):
+        file.write(base64.b64decode(data[start:start + BASE64_CHUNK_SIZE]))
+    file.size = file.tell()
+    file.seek(0)
+    return file
+
+
+def close_decoded_files(data):
+    """Закрывает временные файлы, декодированные из base64.
+
+    Хранилище перемещает файл при сохранении модели, поэтому без явного
+    закрытия дескриптор остается открытым до сборки мусора.
+    """
+    for value in data.values():
+        if isinstance(value, TemporaryUploadedFile):
+            value.close()
+
 
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            try:
+                data = decode_base64_file(imgstr, 'temp.' + ext,
+                                          format.split(':')[-1])
+            except binascii.Error:
+                self.fail('invalid_image')
+            try:
+                return super().to_internal_value(data)
+            except serializers.ValidationError:
+                data.close()
+                raise
         return super().to_internal_value(data)
+
+
+class BulkPrimaryKeyRelatedField(serializers.ListField):
+    default_error_messages = {
+        'does_not_exist': 'Недопустимые первичные ключи: {pk_values}.',
+    }
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        kwargs.setdefault('child', serializers.IntegerField(min_value=1))
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        pks = super().to_internal_value(data)
+        objects = self.queryset.in_bulk(pks)
+        missing = [pk for pk in pks if pk not in objects]
+        if missing:
+            self.fail('does_not_exist',
+                      pk_values=', '.join(map(str, missing)))
+        return [objects[pk] for pk in pks]
+
+    def to_representation(self, value):
+        return [obj.pk for obj in value.all()]
@@ -1,27 +1,147 @@
+from django import forms
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, When
+from django.db.models.expressions import RawSQL
 from django_filters.rest_framework import (
-    AllValuesMultipleFilter, BooleanFilter, CharFilter, FilterSet
+    BaseInFilter, BooleanFilter, CharFilter, ChoiceFilter, Filter, FilterSet
 )
+from django_filters.widgets import QueryArrayWidget
 
-from recipes.models import Ingredient, Recipe
+from api.autocomplete import ingredient_index
+from api.cache import get_version, make_key
+from api.similarity import similarity_index
+from foodgram_backend.constants import (MAX_HAVE_RECIPES,
+                                        MAX_MISSING_INGREDIENTS,
+                                        REFERENCE_CACHE_TIMEOUT, SEARCH_CONFIG)
+from recipes.models import Ingredient, Recipe, RecipeTag, Tag
+
+
+TAGS_MODES = (('any', 'any'), ('all', 'all'))
+
+
+def get_tag_ids():
+    version = get_version(Tag._meta.label_lower)
+    cache_key = make_key(Tag._meta.label_lower, version, 'slugs')
+    tag_ids = cache.get(cache_key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(cache_key, tag_ids, REFERENCE_CACHE_TIMEOUT)
+    return tag_ids
+
+
+class MultipleValueField(forms.Field):
+    widget = QueryArrayWidget
+
+    def to_python(self, value):
+        return [item for values in value or () for item in values.split(',')
+                if item]
+
+
+class IntegerFilter(Filter):
+    field_class = forms.IntegerField
+
+
+class IntegerInFilter(BaseInFilter, IntegerFilter):
+    pass
+
+
+class MultipleValueFilter(Filter):
+    field_class = MultipleValueField
 
 
 class IngredientFilter(FilterSet):
-    name = CharFilter(lookup_expr='istartswith')
+    name = CharFilter(method='filter_name')
+    search = CharFilter(method='filter_search')
 
     class Meta:
         model = Ingredient
-        fields = ('name',)
+        fields = ('name', 'search')
+
+    def filter_name(self, queryset, name, value):
+        return queryset.filter(pk__in=ingredient_index.prefix(value))
+
+    def filter_search(self, queryset, name, value):
+        exact, prefix, contains = ingredient_index.search(value)
+        return queryset.filter(pk__in=(*exact, *prefix, *contains)).annotate(
+            relevance=Case(
+                When(pk__in=exact, then=0),
+                When(pk__in=prefix, then=1),
+                default=2,
+                output_field=IntegerField(),
+            )
+        ).order_by('relevance', 'name')
 
 
 class RecipeFilter(FilterSet):
     is_in_shopping_cart = BooleanFilter(method='filter_is_in_shopping_cart')
     is_favorited = BooleanFilter(method='filter_is_favorited')
-    tags = AllValuesMultipleFilter(field_name='tags__slug')
+    tags = MultipleValueFilter(method='filter_tags')
+    tags_mode = ChoiceFilter(choices=TAGS_MODES, method='filter_tags_mode')
+    search = CharFilter(method='filter_search')
+    have = IntegerInFilter(method='filter_have', min_value=1)
+    missing_max = IntegerFilter(method='filter_missing_max', min_value=0,
+                                max_value=MAX_MISSING_INGREDIENTS)
 
     class Meta:
         model = Recipe
         fields = ('is_in_shopping_cart', 'is_favorited', 'author',
-                  'tags')
+                  'tags', 'tags_mode', 'search', 'have', 'missing_max')
+
+    def filter_tags(self, queryset, name, value):
+        tag_ids = get_tag_ids()
+        found = {tag_ids[slug] for slug in value if slug in tag_ids}
+        if self.form.cleaned_data.get('tags_mode') != 'all':
+            return queryset.filter(Exists(RecipeTag.objects.filter(
+                recipe=OuterRef('pk'), tag_id__in=found)))
+        if len(found) < len(set(value)):
+            return queryset.none()
+        for tag_id in found:
+            queryset = queryset.filter(Exists(RecipeTag.objects.filter(
+                recipe=OuterRef('pk'), tag_id=tag_id)))
+        return queryset
+
+    def filter_tags_mode(self, queryset, name, value):
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value))
+        query = SearchQuery(value, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date')
+
+    def filter_have(self, queryset, name, value):
+        missing_max = self.form.cleaned_data.get('missing_max') or 0
+        candidates = None
+        if queryset.query.where:
+            # Остальные фильтры уже применены: ограничение на число рецептов
+            # должно действовать на прошедшие их рецепты.
+            candidates = queryset.order_by().values_list('pk', flat=True)
+        ids = similarity_index.coverable(value, missing_max, MAX_HAVE_RECIPES,
+                                         candidates)
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return queryset.filter(pk__in=ids).order_by(Case(
+                *(When(pk=pk, then=position)
+                  for position, pk in enumerate(ids)),
+                output_field=IntegerField(),
+            ))
+        quote_name = connection.ops.quote_name
+        column = (f'{quote_name(queryset.model._meta.db_table)}.'
+                  f'{quote_name(queryset.model._meta.pk.column)}')
+        return queryset.filter(pk__in=RawSQL(
+            'SELECT unnest(%s::bigint[])', (ids,)
+        )).order_by(RawSQL(
+            f'array_position(%s::bigint[], {column})', (ids,)
+        ))
+
+    def filter_missing_max(self, queryset, name, value):
+        return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
@@ -0,0 +1,83 @@
+from collections import defaultdict
+import threading
+
+DURATION_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)
+
+HISTOGRAMS = {
+    'foodgram_request_duration_ms': DURATION_BUCKETS,
+    'foodgram_sql_duration_ms': DURATION_BUCKETS,
+    'foodgram_app_duration_ms': DURATION_BUCKETS,
+    'foodgram_sql_queries': QUERY_BUCKETS,
+    'foodgram_response_size_bytes': SIZE_BUCKETS,
+}
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in labels)
+    return f'{{{pairs}}}'
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def render(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield (f'{name}_bucket'
+                   f'{format_labels((*labels, ("le", bound)))} {count}')
+        yield (f'{name}_bucket{format_labels((*labels, ("le", "+Inf")))} '
+               f'{self.count}')
+        yield f'{name}_sum{format_labels(labels)} {self.sum}'
+        yield f'{name}_count{format_labels(labels)} {self.count}'
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(dict)
+        self._counters = defaultdict(lambda: defaultdict(int))
+
+    def observe(self, name, value, **labels):
+        labels = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self._histograms[name].get(labels)
+            if histogram is None:
+                histogram = self._histograms[name][labels] = Histogram(
+                    HISTOGRAMS[name])
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        with self._lock:
+            self._counters[name][tuple(sorted(labels.items()))] += amount
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, histograms in sorted(self._histograms.items()):
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(histograms.items()):
+                    lines.extend(histogram.render(name, labels))
+            for name, counters in sorted(self._counters.items()):
+                lines.append(f'# TYPE {name} counter')
+                for labels, value in sorted(counters.items()):
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
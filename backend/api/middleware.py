@@ -0,0 +1,135 @@
+import asyncio
+from collections import Counter
+from contextlib import ExitStack
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from api.metrics import registry
+from foodgram_backend.constants import (MAX_REQUEST_QUERIES,
+                                        REPEATED_QUERY_THRESHOLD,
+                                        SLOW_REQUEST_MS)
+from foodgram_backend.routers import mark_sticky
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCollector:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += (time.perf_counter() - start) * 1000
+            self.count += 1
+            self.statements[sql] += 1
+
+    def repeated(self):
+        return [(sql, count) for sql, count in self.statements.items()
+                if count >= REPEATED_QUERY_THRESHOLD]
+
+
+def collect_queries(request):
+    """Учитывает запросы к базе текущего потока в метриках запроса request.
+
+    В асинхронном режиме представление выполняется в другом потоке со своими
+    соединениями, поэтому обертки нужно подключать и там.
+    """
+    stack = ExitStack()
+    collector = getattr(request, 'query_collector', None)
+    if collector is not None:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(collector))
+    return stack
+
+
+class HybridMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+class QueryMetricsMiddleware(HybridMiddleware):
+
+    def handle(self, request):
+        request.query_collector = QueryCollector()
+        start = time.perf_counter()
+        with collect_queries(request):
+            response = self.get_response(request)
+        self.record(request, response, start, request.query_collector)
+        return response
+
+    async def __acall__(self, request):
+        request.query_collector = QueryCollector()
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, start, request.query_collector)
+        return response
+
+    def record(self, request, response, start, collector):
+        duration = (time.perf_counter() - start) * 1000
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        size = (0 if response.streaming
+                else len(response.content))
+        registry.observe('foodgram_request_duration_ms', duration, view=view)
+        registry.observe('foodgram_response_size_bytes', size, view=view)
+        registry.observe('foodgram_sql_duration_ms', collector.duration,
+                         view=view)
+        registry.observe('foodgram_app_duration_ms',
+                         duration - collector.duration, view=view)
+        registry.observe('foodgram_sql_queries', collector.count, view=view)
+        repeated = collector.repeated()
+        if repeated:
+            registry.increment('foodgram_repeated_queries_total', view=view)
+            for sql, count in repeated:
+                logger.warning('%s %s: запрос выполнен %s раз: %s',
+                               request.method, view, count, sql)
+        if duration > SLOW_REQUEST_MS or collector.count > MAX_REQUEST_QUERIES:
+            logger.warning(
+                '%s %s: %.1f мс, SQL-запросов: %s (%.1f мс), ответ %s байт',
+                request.method, view, duration, collector.count,
+                collector.duration, size
+            )
+
+
+class ReplicaStickinessMiddleware(HybridMiddleware):
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def handle(self, request):
+        response = self.get_response(request)
+        if self.is_write(request, response):
+            mark_sticky(request.user)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.is_write(request, response):
+            await sync_to_async(mark_sticky)(request.user)
+        return response
+
+    def is_write(self, request, response):
+        user = getattr(request, 'user', None)
+        return (settings.DATABASE_REPLICAS
+                and request.method not in self.safe_methods
+                and response.status_code < 400
+                and user is not None and user.is_authenticated)
@@ -0,0 +1,47 @@
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from api.cache import get_version, make_key
+from foodgram_backend.constants import REFERENCE_CACHE_TIMEOUT
+from foodgram_backend.routers import is_sticky, use_replica
+
+
+class CachedListMixin:
+
+    def list(self, request, *args, **kwargs):
+        model = self.get_queryset().model
+        version = get_version(model._meta.label_lower)
+        full_path = request.get_full_path()
+        cache_key = make_key(model._meta.label_lower, version, full_path)
+        etag = quote_etag(cache_key)
+        last_modified = int(version)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            data = cache.get(cache_key)
+            if data is None:
+                data = list(super().list(request, *args, **kwargs).data)
+                cache.set(cache_key, data, REFERENCE_CACHE_TIMEOUT)
+            response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ReplicaReadMixin:
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (self.action in self.replica_actions
+                and not is_sticky(request.user)):
+            self.replica_token = use_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        replica_token = getattr(self, 'replica_token', None)
+        if replica_token is not None:
+            use_replica.reset(replica_token)
+            self.replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
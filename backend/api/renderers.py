@@ -0,0 +1,126 @@
+import csv
+from io import BytesIO
+import os
+
+from django.conf import settings
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+FONT_NAME = 'DejaVuSans'
+FONT_PATH = os.path.join(settings.BASE_DIR,
+                         'fonts/dajavu_sans/DejaVuSans.ttf')
+TITLE = 'Список ингредиентов для покупок'
+FILENAME = 'Список покупок'
+
+pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+class FormatContentNegotiation(DefaultContentNegotiation):
+
+    def get_accept_list(self, request):
+        return ['*/*']
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except Http404:
+            formats = ', '.join(renderer.format for renderer in renderers)
+            raise ValidationError(
+                {'format': f'Поддерживаемые форматы: {formats}.'})
+
+
+class ShoppingListRenderer(BaseRenderer):
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data, accepted_media_type,
+                                     renderer_context)
+
+    def get_lines(self, ingredients):
+        for number, ingredient in enumerate(ingredients, 1):
+            yield (f"{number}. {ingredient['ingredient__name']}: "
+                   f"{ingredient['total_amount']} "
+                   f"{ingredient['ingredient__measurement_unit']}")
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+    def get_response(self, ingredients):
+        response = StreamingHttpResponse(
+            self.stream(ingredients),
+            content_type=f'{self.media_type}; charset={self.charset}'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{FILENAME}.{self.format}"')
+        return response
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def get_response(self, ingredients):
+        buffer = BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        pdf.setTitle(TITLE)
+        pdf.setFont(FONT_NAME, 16)
+        title_width = pdf.stringWidth(TITLE, FONT_NAME, 16)
+        pdf.drawString((width - title_width) / 2, height - 50, TITLE)
+        pdf.setFont(FONT_NAME, 12)
+        y_position = height - 100
+        for line in self.get_lines(ingredients):
+            pdf.drawString(100, y_position, line)
+            y_position -= 20
+            if y_position < 50:
+                pdf.showPage()
+                pdf.setFont(FONT_NAME, 12)
+                y_position = height - 50
+        pdf.save()
+        buffer.seek(0)
+        return FileResponse(buffer, as_attachment=True,
+                            filename=f'{FILENAME}.{self.format}',
+                            content_type=self.media_type)
+
+
+class TXTShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        yield f'{TITLE}\n\n'
+        for line in self.get_lines(ingredients):
+            yield f'{line}\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('Ингредиент', 'Количество',
+                               'Единица измерения'))
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['total_amount'],
+                ingredient['ingredient__measurement_unit'],
+            ))
+
+
+SHOPPING_LIST_RENDERERS = (PDFShoppingListRenderer, TXTShoppingListRenderer,
+                           CSVShoppingListRenderer)
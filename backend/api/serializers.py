@@ -1,11 +1,20 @@
+from collections import defaultdict
 import re
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
-from api.fields import Base64ImageField
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from api.cache import fragment_keys
+from api.fields import (Base64ImageField, BulkPrimaryKeyRelatedField,
+                        close_decoded_files)
+from api.signals import writing_recipe
+from foodgram_backend.constants import RECIPE_FRAGMENT_TIMEOUT
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            Tag)
 from users.models import Follow
 
 
@@ -58,6 +67,8 @@ class UserSerializer(serializers.ModelSerializer):
                   'is_subscribed', 'avatar')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_authenticated:
             return obj.followers.filter(user=user).exists()
@@ -100,6 +111,67 @@ class RecipeIngredientReadSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class RecipeReadListSerializer(serializers.ListSerializer):
+    """Кэширует независимую от пользователя часть каждого рецепта.
+
+    Ингредиенты, теги и автор загружаются только для рецептов, которых нет
+    в кэше. Флаги пользователя берутся из аннотаций запроса, а изображение
+    и аватар собираются заново, так как их адрес зависит от хоста.
+    """
+
+    viewer_fields = ('is_favorited', 'is_in_shopping_cart', 'image')
+
+    def get_fragment(self, recipe):
+        recipe.author.is_subscribed = False
+        data = self.child.to_representation(recipe)
+        for field in self.viewer_fields:
+            del data[field]
+        author = data['author']
+        del author['is_subscribed']
+        author['avatar'] = (recipe.author.avatar.url
+                            if recipe.author.avatar else None)
+        return data
+
+    def overlay(self, recipe, fragment):
+        author = {
+            **fragment['author'],
+            'is_subscribed': getattr(recipe, 'is_subscribed', False),
+        }
+        if author['avatar']:
+            author['avatar'] = self.context['request'].build_absolute_uri(
+                author['avatar'])
+        values = {
+            **fragment,
+            'author': {name: author[name]
+                       for name in UserSerializer.Meta.fields},
+            'is_favorited': getattr(recipe, 'is_favorited', False),
+            'is_in_shopping_cart': getattr(recipe, 'is_in_shopping_cart',
+                                           False),
+            'image': self.child.get_image(recipe),
+        }
+        return {name: values[name] for name in self.child.Meta.fields}
+
+    def to_representation(self, data):
+        recipes = list(data)
+        keys = fragment_keys(recipes)
+        fragments = cache.get_many(list(keys.values()))
+        misses = [recipe for recipe in recipes
+                  if keys[recipe.pk] not in fragments]
+        if misses:
+            prefetch_related_objects(
+                misses, 'author', 'tags',
+                Prefetch('recipe_ingredients',
+                         queryset=RecipeIngredient.objects.select_related(
+                             'ingredient'))
+            )
+            created = {keys[recipe.pk]: self.get_fragment(recipe)
+                       for recipe in misses}
+            cache.set_many(created, RECIPE_FRAGMENT_TIMEOUT)
+            fragments.update(created)
+        return [self.overlay(recipe, fragments[keys[recipe.pk]])
+                for recipe in recipes]
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     author = UserSerializer()
     tags = TagSerializer(many=True)
@@ -108,6 +180,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image = serializers.SerializerMethodField()
+    image_variant = None
 
     class Meta:
         model = Recipe
@@ -116,47 +190,82 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
         )
         read_only_fields = ('author', 'tags', 'ingredients',)
+        list_serializer_class = RecipeReadListSerializer
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_authenticated:
             return obj.favorite_set.filter(user=user).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_authenticated:
             return obj.cart_set.filter(user=user).exists()
         return False
 
+    def get_image(self, obj):
+        if not obj.image:
+            return None
+        variant = self.image_variant
+        view = self.context.get('view')
+        if variant is None and getattr(view, 'action', None) == 'list':
+            variant = 'small'
+        name = obj.image_variants.get(variant, obj.image.name)
+        return self.context.get('request').build_absolute_uri(
+            obj.image.storage.url(name))
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(source='ingredient_id')
+    name = serializers.CharField(source='ingredient__name')
+    measurement_unit = serializers.CharField(
+        source='ingredient__measurement_unit')
+    amount = serializers.IntegerField(source='total_amount')
+
 
 class ShortRecipeSerializer(RecipeReadSerializer):
-    image = serializers.SerializerMethodField()
+    image_variant = 'small'
 
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
 
-    def get_image(self, obj):
-        request = self.context.get('request')
-        if obj.image:
-            return request.build_absolute_uri(obj.image.url)
-        return None
+
+class RecipeIngredientWriteListSerializer(serializers.ListSerializer):
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients = Ingredient.objects.in_bulk(
+            [item['id'] for item in items])
+        missing = [item['id'] for item in items
+                   if item['id'] not in ingredients]
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: '
+                f"{', '.join(map(str, missing))}."
+            )
+        for item in items:
+            item['id'] = ingredients[item['id']]
+        return items
 
 
 class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-    )
+    id = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
+        list_serializer_class = RecipeIngredientWriteListSerializer
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True, required=True
+    tags = BulkPrimaryKeyRelatedField(
+        queryset=Tag.objects.all(), required=True
     )
     ingredients = RecipeIngredientWriteSerializer(
         source='recipe_ingredients', many=True, required=True
@@ -178,17 +287,69 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         ]
         RecipeIngredient.objects.bulk_create(recipe_ingredient_objs)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients')
         recipe = super().create(validated_data)
         self.create_recipe_igredient(recipe, ingredients_data)
         return recipe
 
+    def update_recipe_ingredients(self, recipe, ingredients_data):
+        amounts = {
+            ingredient_data['id'].id: ingredient_data['amount']
+            for ingredient_data in ingredients_data
+        }
+        existing = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        }
+        changed = []
+        for ingredient_id, recipe_ingredient in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != recipe_ingredient.amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            recipe.recipe_ingredients.filter(
+                ingredient_id__in=removed).delete()
+        added = amounts.keys() - existing.keys()
+        if added:
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                                 amount=amounts[ingredient_id])
+                for ingredient_id in added
+            )
+
+    def update_recipe_tags(self, recipe, tags):
+        tag_ids = {tag.id for tag in tags}
+        existing = set(recipe.recipe_tags.values_list('tag_id', flat=True))
+        removed = existing - tag_ids
+        if removed:
+            recipe.recipe_tags.filter(tag_id__in=removed).delete()
+        added = tag_ids - existing
+        if added:
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag_id=tag_id) for tag_id in added
+            )
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            close_decoded_files(self.validated_data)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('recipe_ingredients')
+        ingredients_data = validated_data.pop('recipe_ingredients', None)
+        tags = validated_data.pop('tags', None)
         instance = super().update(instance, validated_data)
-        instance.recipe_ingredients.all().delete()
-        self.create_recipe_igredient(instance, ingredients_data)
+        with writing_recipe(instance.pk):
+            if ingredients_data is not None:
+                self.update_recipe_ingredients(instance, ingredients_data)
+            if tags is not None:
+                self.update_recipe_tags(instance, tags)
         return instance
 
     def validate_tags(self, value):
@@ -229,30 +390,57 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         return data
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance], 'tags',
+            Prefetch('recipe_ingredients',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient'))
+        )
         return RecipeReadSerializer(
             instance, context=self.context
         ).data
 
 
+class UserWithRecipesListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        authors = list(data)
+        author_recipes = defaultdict(list)
+        for recipe in Recipe.objects.top_by_author(
+                [author.id for author in authors],
+                self.child.get_recipes_limit()):
+            author_recipes[recipe.author_id].append(recipe)
+        self.context['author_recipes'] = author_recipes
+        return super().to_representation(authors)
+
+
 class UserWithRecipes(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(read_only=True, default=0)
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count', 'avatar')
+        list_serializer_class = UserWithRecipesListSerializer
 
-    def get_recipes(self, obj):
+    def get_recipes_limit(self):
         request = self.context.get('request')
-        recipes = obj.recipes.all()
         try:
-            limit = int(request.query_params.get('recipes_limit'))
-            recipes = recipes[:limit]
-        except TypeError:
-            pass
+            return max(int(request.query_params.get('recipes_limit')), 0)
+        except (TypeError, ValueError):
+            return None
+
+    def get_recipes(self, obj):
+        author_recipes = self.context.get('author_recipes')
+        if author_recipes is not None:
+            recipes = author_recipes[obj.id]
+        else:
+            recipes = obj.recipes.all()
+            limit = self.get_recipes_limit()
+            if limit is not None:
+                recipes = recipes[:limit]
         return ShortRecipeSerializer(recipes, many=True,
-                                     context={'request': request}).data
+                                     context=self.context).data
 
 
 class UserRecipeRelationCreateSerializer(serializers.ModelSerializer):
@@ -0,0 +1,64 @@
+import threading
+
+from django.db.models import Max
+
+from api.cache import get_local_version, get_version
+from recipes.models import Recipe
+
+
+VERSION_NAME = 'shortlinks'
+
+
+class RecipeIdBitmap:
+
+    def __init__(self):
+        self._version = None
+        self._bits = bytearray()
+        self._lock = threading.Lock()
+
+    def _get_bits(self):
+        version = get_version(VERSION_NAME)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._bits = self._build()
+                    self._version = version
+        return self._bits
+
+    def _build(self):
+        max_id = Recipe.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        bits = bytearray(max_id // 8 + 1)
+        for pk in Recipe.objects.order_by().values_list(
+                'id', flat=True).iterator():
+            bits[pk >> 3] |= 1 << (pk & 7)
+        return bits
+
+    def add(self, pk):
+        with self._lock:
+            if pk >> 3 >= len(self._bits):
+                self._bits.extend(bytearray((pk >> 3) - len(self._bits) + 1))
+            self._bits[pk >> 3] |= 1 << (pk & 7)
+
+    def is_fresh(self):
+        """Без обращения к хранилищу версий: для асинхронных представлений."""
+        version = get_local_version(VERSION_NAME)
+        return version is not None and version == self._version
+
+    def contains(self, pk):
+        bits = self._bits
+        return (0 < pk and pk >> 3 < len(bits)
+                and bool(bits[pk >> 3] & (1 << (pk & 7))))
+
+    def exists(self, pk):
+        if pk < 1:
+            return False
+        self._get_bits()
+        if self.contains(pk):
+            return True
+        if Recipe.objects.filter(pk=pk).exists():
+            self.add(pk)
+            return True
+        return False
+
+
+recipe_ids = RecipeIdBitmap()
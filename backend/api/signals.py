@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.cache import bump_version
+from api.shortlinks import VERSION_NAME, recipe_ids
+from api.similarity import record_change
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            Tag)
+
+
+User = get_user_model()
+
+_writing = threading.local()
+
+
+@contextmanager
+def writing_recipe(recipe_id):
+    """Строки ингредиентов и тегов рецепта, измененные внутри блока, не
+    отмечают рецепт измененным: он сам сохраняется или удаляется в блоке.
+    """
+    recipe_ids = _writing.__dict__.setdefault('recipe_ids', set())
+    recipe_ids.add(recipe_id)
+    try:
+        yield
+    finally:
+        recipe_ids.discard(recipe_id)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def reference_changed(sender, **kwargs):
+    bump_version(sender._meta.label_lower)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        recipe_ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, **kwargs):
+    bump_version(VERSION_NAME)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    record_change(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver((post_save, post_delete), sender=RecipeTag)
+def recipe_content_changed(sender, instance, **kwargs):
+    if instance.recipe_id in _writing.__dict__.get('recipe_ids', ()):
+        return
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        updated_at=timezone.now())
+    record_change(instance.recipe_id)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True))
+    if keys:
+        token_cache.delete(*keys)
+
+
+@receiver(request_finished)
+def mark_connections_idle(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.idle_since = now
+
+
+@receiver(request_started)
+def close_unusable_connections(**kwargs):
+    """Закрывает оборванные соединения, простаивавшие дольше
+    DB_HEALTH_CHECK_IDLE_SECONDS: проверка стоит запроса SELECT 1, поэтому
+    недавно использованные соединения не проверяются.
+    """
+    if not settings.DB_HEALTH_CHECKS:
+        return
+    idle_since = time.monotonic() - settings.DB_HEALTH_CHECK_IDLE_SECONDS
+    for connection in connections.all():
+        if (connection.connection is not None
+                and getattr(connection, 'idle_since', 0) < idle_since
+                and not connection.is_usable()):
+            connection.close()
@@ -0,0 +1,344 @@
+from datetime import datetime, timezone
+from itertools import chain
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+import numpy as np
+from scipy import sparse
+
+from foodgram_backend.constants import (SIMILARITY_CHANGES_MARGIN,
+                                        SIMILARITY_CHANGES_TIMEOUT,
+                                        SIMILARITY_MAX_CHANGES)
+from recipes.models import Recipe, RecipeChange, RecipeIngredient, RecipeTag
+
+
+METRICS = ('cosine', 'jaccard')
+ARRAYS = ('ids', 'row_indptr', 'row_indices', 'col_indptr', 'col_indices',
+          'meta')
+
+
+def record_change(pk):
+    RecipeChange.objects.create(recipe_id=pk)
+
+
+def prune_changes():
+    return RecipeChange.objects.filter(
+        created__lt=to_datetime(time.time() - SIMILARITY_CHANGES_TIMEOUT)
+    ).delete()[0]
+
+
+def to_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def built_at(arrays):
+    return arrays['meta'][2] / 1000
+
+
+def changes_since(arrays):
+    """Изменения, которые могли не попасть в матрицу.
+
+    Запас SIMILARITY_CHANGES_MARGIN покрывает транзакции, которые начались
+    до построения матрицы, а зафиксированы после.
+    """
+    return RecipeChange.objects.filter(
+        created__gt=to_datetime(built_at(arrays) - SIMILARITY_CHANGES_MARGIN))
+
+
+def get_watermark(arrays):
+    watermark = changes_since(arrays).aggregate(last=Max('id'),
+                                                total=Count('id'))
+    return watermark['last'] or 0, watermark['total']
+
+
+def fetch_pairs(queryset, *fields):
+    return np.fromiter(
+        chain.from_iterable(
+            queryset.order_by().values_list(*fields).iterator()),
+        dtype=np.int64
+    ).reshape(-1, len(fields))
+
+
+def build_arrays():
+    """Матрица рецепт × (ингредиенты + теги) в форматах CSR и CSC.
+
+    Столбец ингредиента равен его id, столбцы тегов сдвинуты на
+    offset = максимальный id ингредиента + 1. В meta также хранится время
+    построения в миллисекундах, от которого отсчитывается журнал изменений.
+    """
+    built = int(time.time() * 1000)
+    ids = fetch_pairs(Recipe.objects.all(), 'id')[:, 0]
+    ids.sort()
+    ingredients = fetch_pairs(RecipeIngredient.objects.all(),
+                              'recipe_id', 'ingredient_id')
+    tags = fetch_pairs(RecipeTag.objects.all(), 'recipe_id', 'tag_id')
+    offset = int(ingredients[:, 1].max()) + 1 if len(ingredients) else 1
+    columns = offset + (int(tags[:, 1].max()) + 1 if len(tags) else 0)
+    recipe_ids = np.concatenate((ingredients[:, 0], tags[:, 0]))
+    rows = np.searchsorted(ids, recipe_ids)
+    known = rows < len(ids)
+    known[known] = ids[rows[known]] == recipe_ids[known]
+    matrix = sparse.csr_matrix(
+        (np.ones(known.sum(), dtype=np.int8),
+         (rows[known],
+          np.concatenate((ingredients[:, 1], tags[:, 1] + offset))[known])),
+        shape=(len(ids), columns)
+    )
+    matrix.sort_indices()
+    transposed = matrix.tocsc()
+    transposed.sort_indices()
+    return {
+        'ids': ids,
+        'row_indptr': matrix.indptr.astype(np.int64),
+        'row_indices': matrix.indices.astype(np.int32),
+        'col_indptr': transposed.indptr.astype(np.int64),
+        'col_indices': transposed.indices.astype(np.int32),
+        'meta': np.array((offset, columns, built), dtype=np.int64),
+    }
+
+
+def save_arrays(arrays, path):
+    os.makedirs(path, exist_ok=True)
+    for name in ARRAYS:
+        filename = os.path.join(path, f'{name}.npy')
+        with open(f'{filename}.tmp', 'wb') as file:
+            np.save(file, arrays[name])
+        os.replace(f'{filename}.tmp', filename)
+
+
+def load_arrays(path):
+    try:
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+            for name in ARRAYS
+        }
+    except (FileNotFoundError, ValueError):
+        return None
+    nnz = len(arrays['row_indices'])
+    if (len(arrays['row_indptr']) != len(arrays['ids']) + 1
+            or len(arrays['col_indptr']) != arrays['meta'][1] + 1
+            or arrays['row_indptr'][-1] != nnz
+            or len(arrays['col_indices']) != nnz):
+        return None
+    return arrays
+
+
+def load_features(pks):
+    features = {
+        pk: (set(), set()) for pk in Recipe.objects.filter(
+            pk__in=pks).values_list('id', flat=True)
+    }
+    for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=features).values_list('recipe_id', 'ingredient_id'):
+        features[recipe_id][0].add(ingredient_id)
+    for recipe_id, tag_id in RecipeTag.objects.filter(
+            recipe_id__in=features).values_list('recipe_id', 'tag_id'):
+        features[recipe_id][1].add(tag_id)
+    return {pk: features.get(pk) for pk in pks}
+
+
+def score(overlap, size, sizes, metric):
+    if metric == 'jaccard':
+        return overlap / (size + sizes - overlap)
+    return overlap / np.sqrt(size * sizes)
+
+
+class SimilarityIndex:
+    """Поиск рецептов с наибольшим пересечением ингредиентов и тегов и
+    рецептов, которые можно приготовить из имеющихся ингредиентов.
+
+    Столбцы CSC служат обратным индексом ингредиент -> рецепты. Базовая
+    матрица строится целиком или загружается из снимка на диске. Рецепты
+    из журнала RecipeChange, измененные после ее построения, хранятся
+    в overrides и учитываются поверх нее, пока матрица не будет заменена.
+    """
+
+    def __init__(self):
+        self._state = None
+        self._lock = threading.Lock()
+
+    def _get_state(self):
+        state = self._state
+        if state is None or get_watermark(state[0]) != state[2]:
+            with self._lock:
+                if self._state is state:
+                    self._state = self._sync(state)
+        return self._state
+
+    def _prepare(self, arrays):
+        """Добавляет размеры строк и плотные строки тегов.
+
+        Тегов мало, и каждый встречается в большой доле рецептов, поэтому
+        их столбцы дешевле складывать как плотные векторы, чем сливать
+        в общий bincount.
+        """
+        arrays = dict(arrays)
+        arrays['sizes'] = np.maximum(
+            np.diff(arrays['row_indptr']), 1).astype(np.float32)
+        offset, columns = arrays['meta'][:2]
+        indptr, indices = arrays['col_indptr'], arrays['col_indices']
+        tag_rows = np.zeros((columns - offset, len(arrays['ids'])),
+                            dtype=np.uint8)
+        for tag, column in enumerate(range(offset, columns)):
+            tag_rows[tag, indices[indptr[column]:indptr[column + 1]]] = 1
+        arrays['tag_rows'] = tag_rows
+        arrays['ingredient_counts'] = (
+            np.diff(arrays['row_indptr']) - tag_rows.sum(axis=0)
+        ).astype(np.int32)
+        return arrays, {}, None, frozenset()
+
+    def _is_recent(self, arrays):
+        return (time.time() - built_at(arrays)
+                < SIMILARITY_CHANGES_TIMEOUT - SIMILARITY_CHANGES_MARGIN)
+
+    def _load_base(self, current=None):
+        """Свежий снимок с диска, если он новее текущей матрицы, иначе
+        матрица, построенная заново."""
+        arrays = load_arrays(settings.SIMILARITY_INDEX_DIR)
+        if (arrays is None or not self._is_recent(arrays)
+                or current is not None
+                and built_at(arrays) <= built_at(current)):
+            arrays = build_arrays()
+        return self._prepare(arrays)
+
+    def _sync(self, state):
+        if state is None:
+            state = self._load_base()
+        arrays, overrides, _, applied = state
+        if not self._is_recent(arrays):
+            # Старые записи журнала удаляются, и по нему уже нельзя
+            # восстановить все изменения после построения матрицы.
+            arrays, overrides, _, applied = self._load_base(arrays)
+        changes = dict(changes_since(arrays).values_list('id', 'recipe_id'))
+        if len(set(changes.values())) > SIMILARITY_MAX_CHANGES:
+            arrays, overrides, _, applied = self._load_base(arrays)
+            changes = dict(
+                changes_since(arrays).values_list('id', 'recipe_id'))
+        pending = {recipe_id for number, recipe_id in changes.items()
+                   if number not in applied}
+        return (arrays, {**overrides, **load_features(pending)},
+                (max(changes, default=0), len(changes)),
+                applied | changes.keys())
+
+    def refresh(self):
+        self._get_state()
+
+    def _row_features(self, arrays, pk):
+        ids = arrays['ids']
+        row = np.searchsorted(ids, pk)
+        if row == len(ids) or ids[row] != pk:
+            return None
+        indptr = arrays['row_indptr']
+        columns = arrays['row_indices'][indptr[row]:indptr[row + 1]]
+        offset = arrays['meta'][0]
+        return (set(columns[columns < offset].tolist()),
+                set((columns[columns >= offset] - offset).tolist()))
+
+    def _ingredient_overlap(self, arrays, ingredients):
+        """Число общих ингредиентов для каждой строки по столбцам CSC."""
+        offset = arrays['meta'][0]
+        selected = np.array(
+            sorted(column for column in ingredients if 0 < column < offset),
+            dtype=np.int64
+        )
+        indptr, indices = arrays['col_indptr'], arrays['col_indices']
+        rows = np.concatenate([
+            indices[start:end] for start, end in zip(
+                indptr[selected], indptr[selected + 1])
+        ] or [np.empty(0, dtype=np.int32)])
+        return np.bincount(rows, minlength=len(arrays['ids']))
+
+    def _stale_rows(self, arrays, pks):
+        ids = arrays['ids']
+        pks = np.fromiter(pks, dtype=np.int64)
+        if not len(ids):
+            return pks[:0]
+        rows = np.searchsorted(ids, pks).clip(max=len(ids) - 1)
+        return rows[ids[rows] == pks]
+
+    def _base_scores(self, arrays, features, metric):
+        ingredients, tags = features
+        overlap = self._ingredient_overlap(
+            arrays, ingredients).astype(np.float32)
+        tag_rows = arrays['tag_rows']
+        for tag in tags:
+            if tag < len(tag_rows):
+                overlap += tag_rows[tag]
+        return score(overlap, len(ingredients) + len(tags), arrays['sizes'],
+                     metric)
+
+    def similar(self, pk, limit, metric='cosine'):
+        arrays, overrides = self._get_state()[:2]
+        if pk in overrides:
+            features = overrides[pk]
+        else:
+            features = self._row_features(arrays, pk)
+        if not features or not (features[0] or features[1]):
+            return []
+        ids = arrays['ids']
+        scores = self._base_scores(arrays, features, metric)
+        scores[self._stale_rows(arrays, chain(overrides, (pk,)))] = 0
+        if len(scores) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(scores))
+        found = [(float(scores[row]), int(ids[row]))
+                 for row in top if scores[row] > 0]
+        ingredients, tags = features
+        size = len(ingredients) + len(tags)
+        for other_pk, other in overrides.items():
+            if not other or other_pk == pk:
+                continue
+            overlap = len(ingredients & other[0]) + len(tags & other[1])
+            if overlap:
+                found.append((
+                    score(overlap, size, len(other[0]) + len(other[1]),
+                          metric),
+                    other_pk
+                ))
+        found.sort(reverse=True)
+        return [other_pk for _, other_pk in found[:limit]]
+
+    def coverable(self, have, missing_max, limit, candidates=None):
+        """id не больше limit рецептов, которым не хватает не больше
+        missing_max ингредиентов из have. Если заданы candidates, рецепты
+        выбираются только из них.
+
+        Рецепты упорядочены по числу недостающих ингредиентов, а затем от
+        новых к старым: pub_date задается при создании, поэтому порядок
+        по убыванию id совпадает с порядком по дате публикации.
+        """
+        arrays, overrides = self._get_state()[:2]
+        have = set(have)
+        counts = arrays['ingredient_counts']
+        missing = counts - self._ingredient_overlap(arrays, have)
+        fits = (missing <= missing_max) & (counts > 0)
+        fits[self._stale_rows(arrays, overrides)] = False
+        if candidates is not None:
+            candidates = set(candidates)
+            fits &= np.isin(arrays['ids'], list(candidates))
+        rows = np.flatnonzero(fits)
+        ids = arrays['ids'][rows]
+        missing = missing[rows].astype(np.int64)
+        keys = missing * (int(ids[-1]) + 1 if len(ids) else 1) - ids
+        if len(keys) > limit:
+            top = np.argpartition(keys, limit - 1)[:limit]
+        else:
+            top = np.arange(len(keys))
+        top = top[np.argsort(keys[top])]
+        found = list(zip(missing[top].tolist(), (-ids[top]).tolist()))
+        for pk, features in overrides.items():
+            if candidates is not None and pk not in candidates:
+                continue
+            if features and features[0]:
+                value = len(features[0] - have)
+                if value <= missing_max:
+                    found.append((value, -pk))
+        found.sort()
+        return [-negative_pk for _, negative_pk in found[:limit]]
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,579 @@
+import base64
+from collections import OrderedDict
+import shutil
+import tempfile
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+import short_url
+
+from api import async_views
+from api.authentication import token_cache
+from api.cache import local_versions
+from api.fields import decode_base64_file
+from api.metrics import MetricsRegistry
+from api.filters import RecipeFilter
+from api.signals import close_unusable_connections, mark_connections_idle
+from api.similarity import (SimilarityIndex, build_arrays, save_arrays,
+                            similarity_index)
+from foodgram_backend.constants import SIMILARITY_CHANGES_TIMEOUT
+from recipes.models import (Cart, Favorite, Ingredient, Recipe, RecipeChange,
+                            RecipeIngredient, RecipeTag, Tag)
+from users.models import Follow
+
+
+User = get_user_model()
+
+
+def count_tags(request):
+    return HttpResponse(Tag.objects.count())
+
+
+# Асинхронные маршруты подключаются только при ASYNC_READ_VIEWS.
+urlpatterns = [
+    path('api/ingredients/', async_views.ingredient_list),
+    path('api/tags/count/', async_views.async_read_view(None, count_tags),
+         name='tag-count'),
+    path('s/<str:link>/', async_views.recipe_from_short_link),
+]
+
+
+class RecipeDataMixin:
+
+    @classmethod
+    def create_users(cls, total):
+        return [
+            User.objects.create(username=f'user{number}',
+                                email=f'user{number}@example.com',
+                                first_name='Имя', last_name='Фамилия')
+            for number in range(total)
+        ]
+
+    @classmethod
+    def create_recipes(cls, total, authors, tags, ingredients):
+        recipes = [
+            Recipe.objects.create(name=f'Рецепт {number}',
+                                  author=authors[number % len(authors)],
+                                  text='Описание', cooking_time=10)
+            for number in range(total)
+        ]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=10)
+            for recipe in recipes for ingredient in ingredients
+        )
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in tags
+        )
+        return recipes
+
+
+class RecipeListQueriesTest(RecipeDataMixin, APITestCase):
+    # Без общего кэша версии фрагментов читаются из таблицы кэша в базе,
+    # но не чаще, чем раз в VERSION_POLL_SECONDS.
+    version_queries = 0 if settings.SHARED_CACHE else 1
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *authors = cls.create_users(4)
+        tags = [Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+                for number in range(3)]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(5)
+        ]
+        recipes = cls.create_recipes(60, authors, tags, ingredients)
+        Follow.objects.create(user=cls.user, following=authors[0])
+        Favorite.objects.create(user=cls.user, recipe=recipes[0])
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_list_queries(self, queries):
+        for limit in (5, 50):
+            with self.subTest(limit=limit):
+                cache.clear()
+                local_versions.clear()
+                with self.assertNumQueries(queries + self.version_queries):
+                    response = self.client.get('/api/recipes/',
+                                               {'limit': limit})
+                self.assertEqual(len(response.data['results']), limit)
+                cache.clear()
+                with self.assertNumQueries(queries):
+                    self.client.get('/api/recipes/', {'limit': limit})
+
+    def test_anonymous_list_queries_do_not_grow_with_page_size(self):
+        self.assert_list_queries(5)
+
+    def test_authenticated_list_queries_do_not_grow_with_page_size(self):
+        self.client.force_authenticate(self.user)
+        self.assert_list_queries(5)
+
+    def test_changed_recipe_and_author_are_not_read_from_cache(self):
+        # Фрагменты со старыми данными остаются в кэше, как после записи
+        # параллельным запросом, но ключи изменившихся рецептов другие.
+        self.client.get('/api/recipes/')
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        recipe.name = 'Новое название'
+        recipe.save()
+        author = recipe.author
+        author.first_name = 'Новое имя'
+        author.save()
+        response = self.client.get('/api/recipes/')
+        item, = [item for item in response.data['results']
+                 if item['id'] == recipe.pk]
+        self.assertEqual(item['name'], 'Новое название')
+        self.assertEqual(item['author']['first_name'], 'Новое имя')
+        self.assertEqual(
+            {item['author']['first_name']
+             for item in response.data['results']
+             if item['author']['id'] == author.pk},
+            {'Новое имя'}
+        )
+
+
+    def test_changed_recipe_rows_are_not_read_from_cache(self):
+        self.client.get('/api/recipes/')
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        recipe_ingredient = recipe.recipe_ingredients.first()
+        recipe_ingredient.amount = 99
+        recipe_ingredient.save()
+        recipe.recipe_tags.first().delete()
+        response = self.client.get('/api/recipes/')
+        item, = [item for item in response.data['results']
+                 if item['id'] == recipe.pk]
+        self.assertIn(99, [ingredient['amount']
+                           for ingredient in item['ingredients']])
+        self.assertEqual(len(item['tags']), 2)
+
+
+class DownloadShoppingCartErrorsTest(APITestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    def test_unauthenticated_error_is_json(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_unknown_format_is_bad_request(self):
+        self.client.force_authenticate(
+            User.objects.create(username='buyer', email='buyer@example.com'))
+        response = self.client.get(self.url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('format', response.json())
+
+    def create_cart(self):
+        user = User.objects.create(username='buyer',
+                                   email='buyer@example.com')
+        recipe = Recipe.objects.create(name='Рецепт', author=user,
+                                       text='Описание', cooking_time=10)
+        RecipeIngredient.objects.create(
+            recipe=recipe, amount=5,
+            ingredient=Ingredient.objects.create(name='Соль',
+                                                 measurement_unit='г'))
+        Cart.objects.create(user=user, recipe=recipe)
+        return Token.objects.create(user=user).key
+
+    async def test_asgi_response_is_streamed_without_queries(self):
+        key = await sync_to_async(self.create_cart)()
+        response = await self.async_client.get(
+            f'{self.url}?format=txt', AUTHORIZATION=f'Token {key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('1. Соль: 5 г',
+                      b''.join(response.streaming_content).decode())
+
+    def test_supported_format_is_rendered(self):
+        self.client.force_authenticate(
+            User.objects.create(username='buyer', email='buyer@example.com'))
+        response = self.client.get(self.url, {'format': 'txt'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+
+
+@override_settings(ROOT_URLCONF='api.tests')
+class AsyncQueryMetricsTest(TestCase):
+
+    def test_async_request_queries_are_recorded(self):
+        registry = MetricsRegistry()
+        with mock.patch('api.middleware.registry', registry):
+            response = async_to_sync(self.async_client.get)(
+                '/api/tags/count/')
+        self.assertEqual(response.content, b'0')
+        self.assertIn('foodgram_sql_queries_sum{view="tag-count"} 1',
+                      registry.render())
+
+    def test_line_breaks_are_ignored(self):
+        content = bytes(range(256)) * 4
+        with mock.patch('api.fields.BASE64_CHUNK_SIZE', 64):
+            file = decode_base64_file(
+                base64.encodebytes(content).decode(), 'temp.png', 'image/png')
+        with file:
+            self.assertEqual(file.read(), content)
+
+
+@override_settings(ROOT_URLCONF='api.tests')
+class AsyncReadViewsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author',
+                                     email='author@example.com')
+        cls.recipe = Recipe.objects.create(name='Рецепт', author=author,
+                                           text='Описание', cooking_time=10)
+        for name in ('Соль', 'Сахар', 'Перец'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        local_versions.clear()
+
+    def get(self, path, **params):
+        # Запросы из синхронного теста, чтобы запросы к базе из
+        # sync_to_async выполнялись в соединении теста и попадали в подсчет.
+        # AsyncClient в Django 3.2 не передает data в строку запроса.
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        return async_to_sync(self.async_client.get)(path)
+
+    def test_ingredient_autocomplete(self):
+        response = self.get('/api/ingredients/', name='са')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['Сахар'])
+        with self.assertNumQueries(0):
+            response = self.get('/api/ingredients/', name='с')
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['Сахар', 'Соль'])
+
+    def test_short_link_redirect(self):
+        link = f'/s/{short_url.encode_url(self.recipe.pk)}/'
+        response = self.get(link)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], f'/recipes/{self.recipe.pk}')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(link).status_code, 302)
+        missing = f'/s/{short_url.encode_url(self.recipe.pk + 1)}/'
+        self.assertEqual(self.get(missing).status_code, 404)
+
+
+class ShortLinkTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author',
+                                     email='author@example.com')
+        cls.recipe = Recipe.objects.create(name='Рецепт', author=author,
+                                           text='Описание', cooking_time=10)
+
+    def setUp(self):
+        local_versions.clear()
+        self.link = f'/s/{short_url.encode_url(self.recipe.pk)}/'
+
+    def test_warm_redirect_runs_no_queries(self):
+        self.assertEqual(self.client.get(self.link).status_code, 302)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.link)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], f'/recipes/{self.recipe.pk}')
+
+    def test_deleted_recipe_is_not_found(self):
+        self.assertEqual(self.client.get(self.link).status_code, 302)
+        self.recipe.delete()
+        self.assertEqual(self.client.get(self.link).status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeWriteQueriesTest(RecipeDataMixin, APITestCase):
+    url = '/api/recipes/'
+    image = (
+        'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywa'
+        'AAAACVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQI'
+        '12NgAAAAAgAB4iG8MwAAAABJRU5ErkJggg=='
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, = cls.create_users(1)
+        cls.tags = [Tag.objects.create(name=f'Тег {number}',
+                                       slug=f'tag{number}')
+                    for number in range(3)]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(60)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def get_payload(self, ingredients, amount=10):
+        return {
+            'ingredients': [{'id': ingredient.id, 'amount': amount}
+                            for ingredient in ingredients],
+            'tags': [tag.id for tag in self.tags],
+            'image': self.image,
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+
+    def test_create_queries_do_not_grow_with_ingredients(self):
+        with self.assertNumQueries(17):
+            response = self.client.post(
+                self.url, self.get_payload(self.ingredients[:50]),
+                format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['ingredients']), 50)
+        self.assertEqual(len(response.data['tags']), 3)
+
+    def test_decoded_image_is_closed_after_save(self):
+        files = []
+
+        def decode(*args):
+            files.append(decode_base64_file(*args))
+            return files[-1]
+
+        with mock.patch('api.fields.decode_base64_file', side_effect=decode):
+            response = self.client.post(
+                self.url, self.get_payload(self.ingredients[:1]),
+                format='json')
+        self.assertEqual(response.status_code, 201)
+        file, = files
+        self.assertTrue(file.closed)
+
+    def test_update_queries_do_not_grow_with_ingredients(self):
+        recipe, = self.create_recipes(1, [self.user], self.tags,
+                                      self.ingredients[:50])
+        payload = self.get_payload(self.ingredients[10:60], amount=20)
+        del payload['image']
+        # Удаляемые строки загружаются для сигналов post_delete.
+        with self.assertNumQueries(18):
+            response = self.client.patch(f'{self.url}{recipe.id}/', payload,
+                                         format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {item['id']: item['amount']
+             for item in response.data['ingredients']},
+            {ingredient.id: 20 for ingredient in self.ingredients[10:60]}
+        )
+
+
+@override_settings(SIMILARITY_INDEX_DIR=tempfile.mkdtemp())
+class SimilarityIndexTest(RecipeDataMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, = cls.create_users(1)
+        cls.tag = Tag.objects.create(name='Тег', slug='tag')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(6)
+        ]
+        cls.recipes = cls.create_recipes(4, [cls.author], [cls.tag],
+                                         cls.ingredients[:3])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.SIMILARITY_INDEX_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        save_arrays(build_arrays(), settings.SIMILARITY_INDEX_DIR)
+        patcher = mock.patch.object(similarity_index, '_state', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_recipe(self):
+        recipe = Recipe.objects.create(name='Новый рецепт', author=self.author,
+                                       text='Описание', cooking_time=10)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=10)
+            for ingredient in self.ingredients[2:]
+        )
+        return recipe
+
+    def test_new_worker_applies_changes_after_snapshot(self):
+        recipe = self.create_recipe()
+        cache.clear()
+        index = SimilarityIndex()
+        self.assertEqual(set(index.similar(recipe.pk, 10)),
+                         {other.pk for other in self.recipes})
+        self.assertIn(recipe.pk, index.coverable(
+            [ingredient.pk for ingredient in self.ingredients[2:]], 0, 10))
+
+    def test_running_worker_applies_changes(self):
+        index = SimilarityIndex()
+        self.assertIn(self.recipes[0].pk,
+                      index.similar(self.recipes[1].pk, 10))
+        recipe = self.create_recipe()
+        self.recipes[0].delete()
+        similar = index.similar(self.recipes[1].pk, 10)
+        self.assertIn(recipe.pk, similar)
+        self.assertNotIn(self.recipes[0].pk, similar)
+
+    def test_running_worker_applies_row_changes(self):
+        index = SimilarityIndex()
+        recipe = self.recipes[0]
+        have = [ingredient.pk for ingredient in self.ingredients[1:3]]
+        self.assertNotIn(recipe.pk, index.coverable(have, 0, 10))
+        recipe.recipe_ingredients.get(ingredient=self.ingredients[0]).delete()
+        self.assertEqual(index.coverable(have, 0, 10), [recipe.pk])
+        RecipeTag.objects.create(
+            recipe=self.recipes[1],
+            tag=Tag.objects.create(name='Новый тег', slug='new'))
+        self.assertTrue(RecipeChange.objects.filter(
+            recipe_id=self.recipes[1].pk).exists())
+
+    def test_outdated_snapshot_is_rebuilt(self):
+        arrays = build_arrays()
+        arrays['meta'][2] -= SIMILARITY_CHANGES_TIMEOUT * 1000
+        save_arrays(arrays, settings.SIMILARITY_INDEX_DIR)
+        RecipeChange.objects.all().delete()
+        recipe = self.create_recipe()
+        RecipeChange.objects.all().delete()
+        self.assertIn(recipe.pk,
+                      SimilarityIndex().similar(self.recipes[0].pk, 10))
+
+    def test_coverable_ranks_by_missing_then_newest(self):
+        recipe = self.create_recipe()
+        have = [ingredient.pk for ingredient in self.ingredients[:3]]
+        newest_first = [other.pk for other in reversed(self.recipes)]
+        index = SimilarityIndex()
+        self.assertEqual(index.coverable(have, 3, 10),
+                         [*newest_first, recipe.pk])
+        self.assertEqual(index.coverable(have, 3, 2), newest_first[:2])
+        self.assertEqual(index.coverable(have, 0, 10), newest_first)
+
+    def test_have_filter_pages_ranked_recipes(self):
+        recipe = self.create_recipe()
+        have = ','.join(str(ingredient.pk)
+                        for ingredient in self.ingredients[:3])
+        response = self.client.get('/api/recipes/', {
+            'have': have, 'missing_max': 3, 'limit': 2, 'page': 3})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         [recipe.pk])
+
+    def test_have_limit_applies_after_other_filters(self):
+        oldest = self.recipes[0]
+        RecipeTag.objects.create(
+            recipe=oldest, tag=Tag.objects.create(name='Ужин', slug='dinner'))
+        have = ','.join(str(ingredient.pk)
+                        for ingredient in self.ingredients[:3])
+        with mock.patch('api.filters.MAX_HAVE_RECIPES', 2):
+            response = self.client.get('/api/recipes/', {
+                'have': have, 'tags': 'dinner'})
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         [oldest.pk])
+
+
+class RecipeTagFilterTest(RecipeDataMixin, APITestCase):
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        author, = cls.create_users(1)
+        cls.tags = [Tag.objects.create(name=f'Тег {number}',
+                                       slug=f'tag{number}')
+                    for number in range(3)]
+        cls.recipes = cls.create_recipes(3, [author], [], [])
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=cls.recipes[number], tag=cls.tags[tag])
+            for number, tag in ((0, 0), (0, 1), (1, 0), (2, 2))
+        )
+
+    def get_ids(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.data['results']]
+        self.assertEqual(len(ids), response.data['count'])
+        return ids
+
+    def test_any_mode_has_no_duplicates(self):
+        ids = self.get_ids({'tags': ['tag0', 'tag1', 'missing']})
+        self.assertCountEqual(ids, [self.recipes[0].id, self.recipes[1].id])
+
+    def test_all_mode_has_no_duplicates(self):
+        self.assertEqual(
+            self.get_ids({'tags': 'tag0,tag1', 'tags_mode': 'all'}),
+            [self.recipes[0].id]
+        )
+        self.assertEqual(
+            self.get_ids({'tags': 'tag0,missing', 'tags_mode': 'all'}), [])
+
+    def test_tags_are_not_loaded_for_validation(self):
+        self.get_ids({'tags': 'tag0'})
+        with CaptureQueriesContext(connection) as context:
+            self.get_ids({'tags': 'tag1,tag2', 'tags_mode': 'all'})
+        self.assertFalse([
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT "recipes_tag"')
+        ])
+
+    @skipUnless(connection.vendor == 'postgresql',
+                'индексы проверяются на PostgreSQL')
+    def test_tag_filter_uses_index(self):
+        queryset = RecipeFilter(
+            {'tags': 'tag0,tag1', 'tags_mode': 'all'},
+            queryset=Recipe.objects.all()
+        ).qs
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn('recipetag_tag_recipe_idx', queryset.explain())
+
+
+class TokenCacheTest(APITestCase):
+    url = '/api/users/me/'
+
+    def setUp(self):
+        user = User.objects.create(username='user', email='user@example.com')
+        self.token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_warm_request_queries(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        # Остается только запрос is_subscribed самого представления.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_token_deleted_in_other_process_is_rejected(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with mock.patch.object(token_cache, '_entries', OrderedDict()), \
+                mock.patch.dict(local_versions):
+            self.token.delete()
+        # До перечитывания версии воркер еще доверяет своему кэшу.
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        local_versions.clear()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class ConnectionHealthCheckTest(TestCase):
+
+    def test_only_idle_connections_are_checked(self):
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'is_usable',
+                               return_value=True) as is_usable:
+            mark_connections_idle()
+            close_unusable_connections()
+            is_usable.assert_not_called()
+            connection.idle_since -= settings.DB_HEALTH_CHECK_IDLE_SECONDS + 1
+            close_unusable_connections()
+            is_usable.assert_called_once_with()
@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from api import async_views
+from api.views import (IngredientViewSet, MetricsView, RecipeViewSet,
+                       TagViewSet, UserViewSet)
 
 
 app_name = 'api'
@@ -14,5 +17,18 @@ router_v1.register('recipes', RecipeViewSet, basename='recipe')
 
 urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
+    path('_metrics', MetricsView.as_view(), name='metrics'),
+]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns += [
+        path('recipes/', async_views.recipe_list, name='recipe-list'),
+        path('recipes/<int:pk>/', async_views.recipe_detail,
+             name='recipe-detail'),
+        path('ingredients/', async_views.ingredient_list,
+             name='ingredient-list'),
+    ]
+
+urlpatterns += [
     path('', include(router_v1.urls)),
 ]
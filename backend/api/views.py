@@ -1,39 +1,59 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Sum
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Value)
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_cache_control
 from djoser.serializers import SetPasswordSerializer
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import status, viewsets
+from rest_framework import serializers, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import (AllowAny, IsAuthenticated,
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated,
                                         IsAuthenticatedOrReadOnly,)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 import short_url
 
+from api.fields import close_decoded_files
 from api.filters import IngredientFilter, RecipeFilter
-from api.paginators import CustomPagination
+from api.metrics import registry
+from api.mixins import CachedListMixin, ReplicaReadMixin
+from api.paginators import CustomPagination, RecipePagination
 from api.permissions import IsAuthorOrReadOnly
+from api.renderers import FormatContentNegotiation, SHOPPING_LIST_RENDERERS
 from api.serializers import (
     AvatarSerializer, IngredientSerializer, FollowSerializer,
     RecipeCreateUpdateSerializer, RecipeReadSerializer,
-    TagSerializer, UserRecipeRelationCreateSerializer,
-    UserRegisterSerializer, UserSerializer, UserWithRecipes
+    ShoppingListItemSerializer, ShortRecipeSerializer, TagSerializer,
+    UserRecipeRelationCreateSerializer, UserRegisterSerializer,
+    UserSerializer, UserWithRecipes
 )
-from api.utils import generate_pdf
-from recipes.models import Cart, Favorite, Ingredient, Recipe, Tag
+from api.shortlinks import recipe_ids
+from api.signals import writing_recipe
+from api.similarity import METRICS, similarity_index
+from foodgram_backend.constants import (MAX_SIMILAR_RECIPES_LIMIT,
+                                        SIMILAR_RECIPES_LIMIT)
+from recipes.models import (Cart, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, Tag)
 from users.models import Follow
 
 
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReplicaReadMixin, CachedListMixin,
+                 viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, CachedListMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
@@ -74,7 +94,10 @@ class UserViewSet(viewsets.ModelViewSet):
             serializer = AvatarSerializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             user.avatar = serializer.validated_data['avatar']
-            user.save()
+            try:
+                user.save()
+            finally:
+                close_decoded_files(serializer.validated_data)
             avatar_url = request.build_absolute_uri(user.avatar.url)
             return Response({'avatar': avatar_url}, status=status.HTTP_200_OK)
         user.avatar.delete()
@@ -85,7 +108,8 @@ class UserViewSet(viewsets.ModelViewSet):
         user = request.user
         paginator = CustomPagination()
         queryset = User.objects.filter(followers__user=user).annotate(
-            recipe_count=Count('recipes')).order_by('-id')
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('-id')
         paginated_queryset = paginator.paginate_queryset(queryset, request)
         serializer = UserWithRecipes(paginated_queryset, many=True,
                                      context={'request': request})
@@ -101,8 +125,8 @@ class UserViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        obj = User.objects.annotate(recipes_count=Count('recipes')).get(id=pk)
-        serializer = UserWithRecipes(obj, context={'request': request})
+        serializer = UserWithRecipes(user_to_follow,
+                                     context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
@@ -118,14 +142,47 @@ class UserViewSet(viewsets.ModelViewSet):
                         status=status.HTTP_400_BAD_REQUEST)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.prefetch_related(
-        'tags', 'ingredients').select_related('author')
+class RecipeViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     http_method_names = ('get', 'post', 'patch', 'delete')
     permission_classes = (IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly)
 
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Recipe.objects.all()
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(
+                    Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+                ),
+                is_in_shopping_cart=Exists(
+                    Cart.objects.filter(user=user, recipe=OuterRef('pk'))
+                ),
+            )
+        if self.action == 'list':
+            queryset = queryset.annotate(
+                author_updated_at=F('author__updated_at'))
+            if not user.is_authenticated:
+                return queryset
+            return queryset.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user,
+                                      following=OuterRef('author_id'))
+            ))
+        queryset = queryset.prefetch_related(
+            'tags',
+            Prefetch('recipe_ingredients',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient'))
+        )
+        if not user.is_authenticated:
+            return queryset.select_related('author')
+        authors = User.objects.annotate(is_subscribed=Exists(
+            Follow.objects.filter(user=user, following=OuterRef('pk'))
+        ))
+        return queryset.prefetch_related(Prefetch('author', queryset=authors))
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeReadSerializer
@@ -134,14 +191,39 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         self.object = serializer.save(author=self.request.user)
 
-    @action(['get'], False, permission_classes=[IsAuthenticated],)
+    def perform_destroy(self, instance):
+        with writing_recipe(instance.pk):
+            instance.delete()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (self.action == 'download_shopping_cart'
+                and getattr(response, 'exception', False)):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    @action(['get'], False, permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_LIST_RENDERERS,
+            content_negotiation_class=FormatContentNegotiation)
     def download_shopping_cart(self, request):
-        user = request.user
-        ingredients_summary = user.cart_set.values(
-            'recipe__ingredients__name',
-            'recipe__ingredients__measurement_unit'
-        ).annotate(total_amount=Sum('recipe__recipe_ingredients__amount'))
-        return generate_pdf(ingredients_summary)
+        ingredients_summary = RecipeIngredient.objects.shopping_list(
+            request.user)
+        # Под ASGI потоковый ответ читается в цикле событий, где запросы
+        # к базе данных запрещены, поэтому строки загружаются заранее.
+        if isinstance(request._request, ASGIRequest):
+            ingredients_summary = list(ingredients_summary)
+        else:
+            ingredients_summary = ingredients_summary.iterator()
+        return request.accepted_renderer.get_response(ingredients_summary)
+
+    @action(['get'], False, permission_classes=[IsAuthenticated],
+            url_path='shopping_cart/summary')
+    def shopping_cart_summary(self, request):
+        ingredients_summary = RecipeIngredient.objects.shopping_list(
+            request.user)
+        serializer = ShoppingListItemSerializer(ingredients_summary,
+                                                many=True)
+        return Response(serializer.data)
 
     def create_user_recipe_relation(self, request, model, pk):
         user = request.user
@@ -184,13 +266,60 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(['get'], True, permission_classes=[AllowAny],
             url_path='get-link')
     def get_link(self, request, pk=None):
+        if not pk.isdigit() or not recipe_ids.exists(int(pk)):
+            raise Http404
         domain = request.get_host()
         s_url = short_url.encode_url(int(pk))
         url = f'https://{domain}/s/{s_url}'
         return Response({'short-link': url}, status=status.HTTP_200_OK)
 
+    @action(['get'], True, permission_classes=[AllowAny])
+    def similar(self, request, pk=None):
+        if not pk.isdigit() or not recipe_ids.exists(int(pk)):
+            raise Http404
+        metric = request.query_params.get('metric', METRICS[0])
+        if metric not in METRICS:
+            raise serializers.ValidationError(
+                {'metric': f'Допустимые значения: {", ".join(METRICS)}.'})
+        try:
+            limit = int(request.query_params.get('limit',
+                                                 SIMILAR_RECIPES_LIMIT))
+        except ValueError:
+            limit = SIMILAR_RECIPES_LIMIT
+        limit = min(max(limit, 1), MAX_SIMILAR_RECIPES_LIMIT)
+        ids = similarity_index.similar(int(pk), limit, metric)
+        recipes = Recipe.objects.in_bulk(ids)
+        serializer = ShortRecipeSerializer(
+            [recipes[id] for id in ids if id in recipes], many=True,
+            context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+
+class MetricsView(APIView):
+    """Метрики в формате Prometheus из памяти текущего процесса.
+
+    При нескольких воркерах ответ содержит метрики только того воркера,
+    который обработал запрос.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
 
 def recipe_from_short_link(request, link):
-    id = short_url.decode_url(link)
-    recipe = get_object_or_404(Recipe, id=id)
-    return redirect(f'/recipes/{recipe.id}')
+    try:
+        id = short_url.decode_url(link)
+    except ValueError:
+        raise Http404
+    if not recipe_ids.exists(id):
+        raise Http404
+    response = redirect(f'/recipes/{id}')
+    if settings.SHORT_LINK_CACHE_SECONDS:
+        patch_cache_control(response, public=True,
+                            max_age=settings.SHORT_LINK_CACHE_SECONDS)
+    return response
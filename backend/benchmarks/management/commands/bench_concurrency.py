@@ -0,0 +1,96 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+from benchmarks.utils import percentile, save_results
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = None
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    if length is None:
+        await reader.read()
+        return status, False
+    await reader.readexactly(length)
+    return status, True
+
+
+async def worker(host, port, paths, deadline, timings, errors):
+    reader = writer = None
+    index = 0
+    while time.perf_counter() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection(host, port)
+        path = paths[index % len(paths)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'
+                         .encode())
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError):
+            errors.append(None)
+            writer = None
+            continue
+        timings.append((time.perf_counter() - start) * 1000)
+        if status >= 400:
+            errors.append(status)
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, paths, connections, duration):
+    parts = urlsplit(url)
+    deadline = time.perf_counter() + duration
+    timings, errors = [], []
+    await asyncio.gather(*(
+        worker(parts.hostname, parts.port or 80, paths, deadline, timings,
+               errors)
+        for _ in range(connections)
+    ))
+    return timings, errors
+
+
+class Command(BaseCommand):
+    help = ('Нагрузка на запущенный сервер с большим числом одновременных '
+            'соединений, для сравнения WSGI и ASGI')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='например http://localhost:8000')
+        parser.add_argument('--paths', nargs='+', default=(
+            '/api/recipes/', '/api/recipes/1/',
+            '/api/ingredients/?name=%D1%81%D1%8B%D1%80', '/s/867nv/'))
+        parser.add_argument('--connections', type=int, default=500)
+        parser.add_argument('--duration', type=float, default=30)
+        parser.add_argument('--label', default='server')
+        parser.add_argument('--output', help='файл для сохранения в JSON')
+
+    def handle(self, *args, **options):
+        timings, errors = asyncio.run(run(
+            options['url'], options['paths'], options['connections'],
+            options['duration']))
+        if not timings:
+            self.stderr.write('Ни один запрос не выполнен.')
+            return
+        result = {
+            'connections': options['connections'],
+            'requests': len(timings),
+            'errors': len(errors),
+            'rps': round(len(timings) / options['duration'], 1),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+        }
+        self.stdout.write(f"{options['label']}: {result}")
+        if options['output']:
+            save_results(options['output'], {options['label']: result})
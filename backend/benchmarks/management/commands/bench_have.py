@@ -0,0 +1,71 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Q
+from django.test.utils import override_settings
+
+from api.filters import RecipeFilter
+from api.similarity import similarity_index
+from benchmarks.utils import format_row, get_client, measure, save_results
+from recipes.models import Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = ('Сравнение поиска рецептов по имеющимся ингредиентам '
+            '(?have=&missing_max=) через индекс и через GROUP BY в SQL')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--have', type=int, default=20,
+                            help='количество имеющихся ингредиентов')
+        parser.add_argument('--missing-max', type=int, default=2)
+        parser.add_argument('--page-size', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--output', help='файл для сохранения в JSON')
+
+    def sql_page(self, have, missing_max, page_size):
+        return list(Recipe.objects.annotate(
+            total=Count('recipe_ingredients'),
+            found=Count('recipe_ingredients',
+                        filter=Q(recipe_ingredients__ingredient_id__in=have)),
+        ).annotate(missing=F('total') - F('found')).filter(
+            total__gt=0, missing__lte=missing_max
+        ).order_by('missing', '-pub_date').values_list(
+            'id', flat=True)[:page_size])
+
+    def index_page(self, have, missing_max, page_size):
+        filterset = RecipeFilter(
+            {'have': ','.join(map(str, have)), 'missing_max': missing_max},
+            queryset=Recipe.objects.all()
+        )
+        return list(filterset.qs.values_list('id', flat=True)[:page_size])
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        ingredient_ids = list(RecipeIngredient.objects.values_list(
+            'ingredient_id', flat=True).distinct())
+        if len(ingredient_ids) < options['have']:
+            raise CommandError('Сначала создайте рецепты: generate_data.')
+        have = random.sample(ingredient_ids, options['have'])
+        missing_max = options['missing_max']
+        page_size = options['page_size']
+        similarity_index.refresh()
+        requests = {
+            'have_sql': lambda: self.sql_page(have, missing_max, page_size),
+            'have_index': lambda: self.index_page(have, missing_max,
+                                                  page_size),
+        }
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            client = get_client()
+            requests['have_api'] = lambda: client.get('/api/recipes/', {
+                'have': ','.join(map(str, have)),
+                'missing_max': missing_max,
+                'limit': page_size,
+            })
+            for name, request in requests.items():
+                result = measure(request, options['repeat'])
+                results[name] = result
+                self.stdout.write(format_row(name, result))
+        if options['output']:
+            save_results(options['output'], results)
@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.pagination import Cursor
+
+from api.paginators import RecipeCursorPagination
+from benchmarks.utils import format_row, get_client, measure, save_results
+from recipes.models import Recipe
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Сравнение времени ответа первой и глубокой страницы '
+            '/api/recipes/ для постраничной и курсорной пагинации')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate', type=int, default=0,
+                            help='создать столько синтетических рецептов')
+        parser.add_argument('--page-size', type=int, default=6)
+        parser.add_argument('--deep-page', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--output', help='файл для сохранения в JSON')
+
+    def generate(self, total, batch_size):
+        author, _ = User.objects.get_or_create(
+            username='bench_author',
+            defaults={'email': 'bench_author@example.com'}
+        )
+        start = Recipe.objects.count()
+        for offset in range(start, start + total, batch_size):
+            Recipe.objects.bulk_create(
+                Recipe(name=f'bench-recipe-{number}', author=author,
+                       text='Синтетический рецепт', cooking_time=10)
+                for number in range(offset,
+                                    min(offset + batch_size, start + total))
+            )
+        self.stdout.write(f'Создано рецептов: {total}')
+
+    def get_cursor(self, offset):
+        paginator = RecipeCursorPagination()
+        paginator.base_url = '/api/recipes/'
+        recipe = Recipe.objects.order_by(*paginator.ordering)[offset]
+        return paginator.encode_cursor(
+            Cursor(offset=0, reverse=False, position=str(recipe.pub_date))
+        ).split('cursor=')[-1]
+
+    def handle(self, *args, **options):
+        if options['generate']:
+            self.generate(options['generate'], options['batch_size'])
+        page_size = options['page_size']
+        deep_page = options['deep_page']
+        deep_cursor = self.get_cursor((deep_page - 1) * page_size)
+        urls = {
+            'page_1': f'/api/recipes/?limit={page_size}',
+            'page_deep': (f'/api/recipes/?limit={page_size}'
+                          f'&page={deep_page}'),
+            'page_deep_no_count': (f'/api/recipes/?limit={page_size}'
+                                   f'&page={deep_page}&count=false'),
+            'cursor_1': f'/api/recipes/?limit={page_size}&cursor=',
+            'cursor_deep': (f'/api/recipes/?limit={page_size}'
+                            f'&cursor={deep_cursor}'),
+        }
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            client = get_client()
+            for name, url in urls.items():
+                result = measure(lambda: client.get(url), options['repeat'])
+                results[name] = result
+                self.stdout.write(format_row(name, result))
+        if options['output']:
+            save_results(options['output'], results)
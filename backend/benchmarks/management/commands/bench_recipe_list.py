@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from benchmarks.utils import format_row, get_client, measure, save_results
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Замер времени ответа /api/recipes/ при разных размерах страницы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', type=int, nargs='+',
+                            default=(10, 50, 200))
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--user', help='email пользователя для запросов')
+        parser.add_argument('--output', help='файл для сохранения в JSON')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(email=options['user']).first()
+            if user is None:
+                raise CommandError('Пользователь не найден.')
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            client = get_client(user)
+            for page_size in options['page_sizes']:
+                url = f'/api/recipes/?limit={page_size}'
+                result = measure(lambda: client.get(url), options['repeat'])
+                results[f'recipes_list_{page_size}'] = result
+                self.stdout.write(format_row(url, result))
+        if options['output']:
+            save_results(options['output'], results)
@@ -0,0 +1,40 @@
+from itertools import cycle
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from api.similarity import METRICS, similarity_index
+from benchmarks.utils import format_row, get_client, measure, save_results
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Замер времени ответа /api/recipes/{id}/similar/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--output', help='файл для сохранения в JSON')
+
+    def handle(self, *args, **options):
+        recipe_ids = list(Recipe.objects.order_by('?').values_list(
+            'id', flat=True)[:options['repeat']])
+        if not recipe_ids:
+            raise CommandError('Сначала создайте рецепты: generate_data.')
+        similarity_index.refresh()
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            client = get_client()
+            for metric in METRICS:
+                pks = cycle(recipe_ids)
+                result = measure(
+                    lambda: client.get(
+                        f'/api/recipes/{next(pks)}/similar/',
+                        {'limit': options['limit'], 'metric': metric}
+                    ),
+                    options['repeat']
+                )
+                results[f'similar_{metric}'] = result
+                self.stdout.write(format_row(f'similar ({metric})', result))
+        if options['output']:
+            save_results(options['output'], results)
@@ -0,0 +1,133 @@
+import random
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import (Cart, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, Tag)
+from recipes.utils import bulk_create
+from users.models import Follow
+
+
+User = get_user_model()
+
+BENCH_PASSWORD = 'benchmark-password'
+BENCH_TAGS = (('Завтрак', 'breakfast'), ('Обед', 'lunch'),
+              ('Ужин', 'dinner'))
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = 'Создает синтетические данные для бенчмарков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--follows', type=int, default=10,
+                            help='подписок на пользователя')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='рецептов в избранном на пользователя')
+        parser.add_argument('--carts', type=int, default=10,
+                            help='рецептов в корзине на пользователя')
+        parser.add_argument('--min-ingredients', type=int, default=5)
+        parser.add_argument('--max-ingredients', type=int, default=30)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int)
+
+    def create_users(self, run, total):
+        password = make_password(BENCH_PASSWORD)
+        users = bulk_create(User, (
+            User(username=f'bench_{run}_{number}',
+                 email=f'bench_{run}_{number}@example.com',
+                 first_name='Бенчмарк', last_name=str(number),
+                 password=password)
+            for number in range(total)
+        ), 'username')
+        return [user.pk for user in users]
+
+    def get_tag_ids(self):
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if tag_ids:
+            return tag_ids
+        tags = bulk_create(Tag, (Tag(name=name, slug=slug)
+                                 for name, slug in BENCH_TAGS), 'slug')
+        return [tag.pk for tag in tags]
+
+    def create_recipes(self, run, total, user_ids, options):
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if len(ingredient_ids) < options['max_ingredients']:
+            raise CommandError('Сначала загрузите ингредиенты: run_import.')
+        tag_ids = self.get_tag_ids()
+        recipe_ids = []
+        for numbers in chunks(range(total), options['batch_size']):
+            recipes = bulk_create(Recipe, (
+                Recipe(name=f'Рецепт {run}-{number}',
+                       author_id=random.choice(user_ids),
+                       text='Синтетический рецепт для бенчмарков. ' * 5,
+                       cooking_time=random.randint(5, 180))
+                for number in numbers
+            ), 'name')
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                                 amount=random.randint(1, 500))
+                for recipe in recipes
+                for ingredient_id in random.sample(
+                    ingredient_ids,
+                    random.randint(options['min_ingredients'],
+                                   options['max_ingredients']))
+            )
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag_id=tag_id)
+                for recipe in recipes
+                for tag_id in random.sample(
+                    tag_ids, random.randint(1, len(tag_ids)))
+            )
+            recipe_ids.extend(recipe.pk for recipe in recipes)
+            self.stdout.write(f'Рецептов создано: {len(recipe_ids)}')
+        return recipe_ids
+
+    def create_relations(self, model, user_ids, target_ids, per_user,
+                         batch_size, field):
+        objects = (
+            model(user_id=user_id, **{field: target_id})
+            for user_id in user_ids
+            for target_id in random.sample(
+                target_ids, min(per_user, len(target_ids)))
+            if target_id != user_id or field != 'following_id'
+        )
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        run = uuid.uuid4().hex[:8]
+        batch_size = options['batch_size']
+        user_ids = self.create_users(run, options['users'])
+        recipe_ids = self.create_recipes(run, options['recipes'], user_ids,
+                                         options)
+        self.create_relations(Follow, user_ids, user_ids,
+                              options['follows'], batch_size,
+                              'following_id')
+        self.create_relations(Favorite, user_ids, recipe_ids,
+                              options['favorites'], batch_size, 'recipe_id')
+        self.create_relations(Cart, user_ids, recipe_ids, options['carts'],
+                              batch_size, 'recipe_id')
+        Recipe.objects.filter(
+            name__startswith=f'Рецепт {run}-').update_search_vector()
+        call_command('recalculate_counters', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Пользователи bench_{run}_*, '
+            f'пароль {BENCH_PASSWORD}.'
+        ))
@@ -0,0 +1,128 @@
+from datetime import datetime
+import itertools
+import json
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test.utils import override_settings
+
+from benchmarks.utils import format_row, get_client, measure, save_results
+from recipes.models import Ingredient, Recipe, Tag
+
+
+User = get_user_model()
+
+PIXEL = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+         'FcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==')
+SCENARIOS = ('recipes', 'subscriptions', 'ingredients', 'create', 'patch',
+             'shopping_cart')
+
+
+class Command(BaseCommand):
+    help = 'Прогоняет сценарии нагрузки на API и сохраняет результаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='email пользователя для запросов')
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS,
+                            default=SCENARIOS)
+        parser.add_argument('--output', help='файл для сохранения в JSON')
+        parser.add_argument('--compare', help='JSON предыдущего запуска')
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            user = User.objects.annotate(
+                follows=Count('following')).order_by('-follows').first()
+        if user is None:
+            raise CommandError('Пользователь не найден, '
+                               'сначала выполните generate_data.')
+        return user
+
+    def recipe_payload(self, name):
+        ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)[:10])
+        return {
+            'name': name,
+            'text': 'Рецепт, созданный бенчмарком',
+            'cooking_time': 10,
+            'image': PIXEL,
+            'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+            'ingredients': [{'id': pk, 'amount': random.randint(1, 100)}
+                            for pk in ingredient_ids],
+        }
+
+    def get_requests(self, client, user, scenarios, run):
+        counter = itertools.count()
+        requests = {}
+        if 'recipes' in scenarios:
+            requests['recipes_list'] = lambda: client.get(
+                '/api/recipes/?limit=6')
+            requests['recipes_list_50'] = lambda: client.get(
+                '/api/recipes/?limit=50')
+        if 'subscriptions' in scenarios:
+            requests['subscriptions'] = lambda: client.get(
+                '/api/users/subscriptions/?limit=6&recipes_limit=3')
+        if 'ingredients' in scenarios:
+            requests['ingredients_autocomplete'] = lambda: client.get(
+                '/api/ingredients/',
+                {'name': random.choice(('а', 'мо', 'сыр', 'кар'))})
+        if 'create' in scenarios:
+            requests['recipe_create'] = lambda: client.post(
+                '/api/recipes/',
+                self.recipe_payload(f'bench-{run}-{next(counter)}'),
+                content_type='application/json')
+        if 'patch' in scenarios:
+            response = client.post(
+                '/api/recipes/', self.recipe_payload(f'bench-{run}-patch'),
+                content_type='application/json')
+            if response.status_code != 201:
+                raise CommandError(f'Не удалось создать рецепт: '
+                                   f'{response.content[:200]}')
+            url = f"/api/recipes/{response.json()['id']}/"
+            requests['recipe_patch'] = lambda: client.patch(
+                url, self.recipe_payload(f'bench-{run}-patch'),
+                content_type='application/json')
+        if 'shopping_cart' in scenarios:
+            requests['download_shopping_cart'] = lambda: client.get(
+                '/api/recipes/download_shopping_cart/')
+        return requests
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            previous = json.load(file)['results']
+        for name, result in results.items():
+            if name in previous:
+                before = previous[name]['p50_ms']
+                self.stdout.write(
+                    f"{name:<40} p50 {before} -> {result['p50_ms']} ms "
+                    f"({(result['p50_ms'] - before) / before:+.0%})")
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        run = datetime.now().strftime('%Y%m%d%H%M%S')
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            client = get_client(user)
+            try:
+                requests = self.get_requests(client, user,
+                                             options['scenarios'], run)
+                for name, request in requests.items():
+                    result = measure(request, options['repeat'])
+                    results[name] = result
+                    self.stdout.write(format_row(name, result))
+            finally:
+                Recipe.objects.filter(
+                    name__startswith=f'bench-{run}-').delete()
+        if options['compare']:
+            self.compare(options['compare'], results)
+        if options['output']:
+            save_results(options['output'], {
+                'started_at': run,
+                'user': user.email,
+                'recipes': Recipe.objects.count(),
+                'results': results,
+            })
@@ -0,0 +1,24 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+
+class GenerateDataTest(TestCase):
+
+    def test_creates_linked_data(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(5)
+        )
+        call_command('generate_data', users=3, recipes=7, follows=1,
+                     favorites=2, carts=2, min_ingredients=1,
+                     max_ingredients=5, batch_size=4, seed=1,
+                     stdout=StringIO())
+        self.assertEqual(Recipe.objects.count(), 7)
+        self.assertFalse(
+            Recipe.objects.filter(recipe_ingredients=None).exists())
+        self.assertEqual(
+            RecipeIngredient.objects.values('recipe').distinct().count(), 7)
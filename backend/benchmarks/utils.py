@@ -0,0 +1,56 @@
+import json
+import statistics
+import time
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+
+def get_client(user=None):
+    if user is None:
+        return Client()
+    token, _ = Token.objects.get_or_create(user=user)
+    return Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def measure(request, repeat):
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - start) * 1000)
+        if getattr(response, 'status_code', 200) >= 400:
+            raise RuntimeError(
+                f'Запрос завершился с кодом {response.status_code}'
+            )
+        queries.append(len(context.captured_queries))
+    return {
+        'repeat': repeat,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'queries': max(queries),
+        'rps': round(repeat / (sum(timings) / 1000), 1),
+    }
+
+
+def format_row(name, result):
+    return (f"{name:<40} p50={result['p50_ms']:>8} ms "
+            f"p95={result['p95_ms']:>8} ms p99={result['p99_ms']:>8} ms "
+            f"queries={result['queries']:>4} rps={result['rps']:>7}")
+
+
+def save_results(path, results):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
@@ -1,8 +1,15 @@
 python manage.py makemigrations --no-input
 python manage.py migrate --no-input
+python manage.py createcachetable
+python manage.py update_search_vector --missing
+python manage.py recalculate_counters
 python manage.py run_import
 python manage.py collectstatic --no-input --clear
 
 cp -r /app/collected_static/. /backend_static/static/
 
-gunicorn --bind 0:8000 foodgram_backend.wsgi
\ No newline at end of file
+if [ "$SERVER_MODE" = "asgi" ]; then
+    gunicorn --bind 0:8000 -k uvicorn.workers.UvicornWorker foodgram_backend.asgi
+else
+    gunicorn --bind 0:8000 foodgram_backend.wsgi
+fi
\ No newline at end of file
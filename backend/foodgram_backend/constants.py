@@ -8,3 +8,23 @@ MEASURMENT_MAX_LEN = 15
 MIN_AMOUNT = 1
 MAX_AMOUNT = 999
 PAGINATION_PAGE_NUMBER = 6
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+SEARCH_CONFIG = 'russian'
+BASE64_CHUNK_SIZE = 4 * 64 * 1024
+IMAGE_VARIANTS = {
+    'small': (320, 320),
+    'medium': (960, 960),
+}
+WEBP_QUALITY = 80
+SLOW_REQUEST_MS = 500
+MAX_REQUEST_QUERIES = 20
+REPEATED_QUERY_THRESHOLD = 5
+SIMILAR_RECIPES_LIMIT = 6
+MAX_SIMILAR_RECIPES_LIMIT = 50
+SIMILARITY_CHANGES_TIMEOUT = 60 * 60 * 24
+SIMILARITY_CHANGES_MARGIN = 60
+SIMILARITY_MAX_CHANGES = 5000
+MAX_MISSING_INGREDIENTS = 10
+MAX_HAVE_RECIPES = 1000
+TOKEN_CACHE_SIZE = 10000
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60
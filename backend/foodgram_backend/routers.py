@@ -0,0 +1,37 @@
+from contextvars import ContextVar
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+use_replica = ContextVar('use_replica', default=False)
+
+
+def get_sticky_key(user):
+    return f'replica-sticky:{user.pk}'
+
+
+def mark_sticky(user):
+    cache.set(get_sticky_key(user), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user):
+    return user.is_authenticated and cache.get(get_sticky_key(user), False)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if use_replica.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
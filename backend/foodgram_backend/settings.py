@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from environs import Env
 
 from foodgram_backend.constants import PAGINATION_PAGE_NUMBER
@@ -31,6 +32,7 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
+    'benchmarks.apps.BenchmarksConfig',
 ]
 
 MIDDLEWARE = [
@@ -41,6 +43,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.QueryMetricsMiddleware',
+    'api.middleware.ReplicaStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram_backend.urls'
@@ -63,16 +67,73 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram_backend.wsgi.application'
 
-DATABASES = {
+# Миграции создаются при запуске контейнера, поэтому тестовая база
+# строится сразу по моделям.
+TEST_DATABASE = {'MIGRATE': False, 'SERIALIZE': False}
+
+if env.bool('USE_SQLITE', False):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'TEST': TEST_DATABASE,
+        }
+    }
+else:
+    DB_PGBOUNCER = env.bool('DB_PGBOUNCER', False)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'django'),
+            'USER': os.getenv('POSTGRES_USER', 'django'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', 5432),
+            'CONN_MAX_AGE': (0 if DB_PGBOUNCER
+                             else env.int('DB_CONN_MAX_AGE', 60)),
+            'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
+            'TEST': TEST_DATABASE,
+        }
+    }
+    for number, host in enumerate(env.list('DB_REPLICA_HOSTS', [])):
+        DATABASES[f'replica_{number}'] = {
+            **DATABASES['default'],
+            'HOST': host,
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['foodgram_backend.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = env.int('REPLICA_STICKY_SECONDS', 10)
+DB_HEALTH_CHECKS = env.bool('DB_HEALTH_CHECKS', True)
+DB_HEALTH_CHECK_IDLE_SECONDS = env.int('DB_HEALTH_CHECK_IDLE_SECONDS', 30)
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('POSTGRES_DB', 'django'),
-        'USER': os.getenv('POSTGRES_USER', 'django'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
-        'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+SHARED_CACHE = CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+# Версии кэшированных данных должны быть видны всем процессам, поэтому
+# без общего кэша они хранятся в таблице кэша в базе данных.
+CACHES['versions'] = CACHES['default'] if SHARED_CACHE else {
+    'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+    'LOCATION': 'cache_versions',
+}
+# Как часто процесс перечитывает версии из общего хранилища, секунд.
+VERSION_POLL_SECONDS = env.int('VERSION_POLL_SECONDS', 1)
+# Отметки о недавней записи в ReplicaRouter должны быть видны всем воркерам.
+if DATABASE_REPLICAS and not SHARED_CACHE:
+    raise ImproperlyConfigured(
+        'Для DB_REPLICA_HOSTS нужен общий кэш: задайте CACHE_BACKEND.')
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -109,13 +170,26 @@ MEDIA_ROOT = '/media/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+IMAGE_WORKERS = env.int('IMAGE_WORKERS', 2)
+
+SHORT_LINK_CACHE_SECONDS = env.int('SHORT_LINK_CACHE_SECONDS', 0)
+
+TOKEN_CACHE_SECONDS = env.int('TOKEN_CACHE_SECONDS', 60)
+TOKEN_CACHE_ALIAS = os.getenv('TOKEN_CACHE_ALIAS', '')
+
+SIMILARITY_INDEX_DIR = os.getenv('SIMILARITY_INDEX_DIR',
+                                 BASE_DIR / 'similarity_index')
+
+ASYNC_READ_VIEWS = env.bool('ASYNC_READ_VIEWS',
+                            os.getenv('SERVER_MODE') == 'asgi')
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.paginators.CustomPagination',
     'PAGE_SIZE': PAGINATION_PAGE_NUMBER
@@ -3,13 +3,15 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
-from api.views import recipe_from_short_link
+from api import async_views, views
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls', namespace='api')),
-    path('s/<str:link>/', recipe_from_short_link),
+    path('s/<str:link>/', (async_views.recipe_from_short_link
+                           if settings.ASYNC_READ_VIEWS
+                           else views.recipe_from_short_link)),
 ]
 
 if settings.DEBUG:
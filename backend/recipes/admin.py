@@ -28,19 +28,11 @@ class IngredientAdmin(admin.ModelAdmin):
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientInline, RecipeTagInline)
     fields = ('name', 'author', 'text', 'cooking_time',
-              'image', 'favorite_count')
-    list_display = ('name', 'author', 'in_favorite_count',)
+              'image', 'favorites_count')
+    list_display = ('name', 'author', 'favorites_count',)
     search_fields = ('name', 'author__username')
     list_filter = ('tags',)
-    readonly_fields = ('favorite_count',)
-
-    @admin.display(description='В избранном')
-    def in_favorite_count(self, obj):
-        return obj.favorite_set.count()
-
-    @admin.display(description='Количество добавлений в избранное')
-    def favorite_count(self, obj):
-        return obj.favorite_set.count()
+    readonly_fields = ('favorites_count',)
 
 
 @admin.register(RecipeIngredient)
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+from foodgram_backend.constants import IMAGE_VARIANTS, WEBP_QUALITY
+from recipes.models import Recipe
+
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                              thread_name_prefix='image-variants')
+
+
+def render_variant(image, size):
+    variant = image.copy()
+    variant.thumbnail(size)
+    buffer = BytesIO()
+    variant.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def build_variants(recipe_id, image_name):
+    try:
+        variants = {'source': image_name}
+        base_name = os.path.splitext(image_name)[0]
+        with default_storage.open(image_name) as file:
+            with Image.open(file) as image:
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA')
+                for variant, size in IMAGE_VARIANTS.items():
+                    variants[variant] = default_storage.save(
+                        f'{base_name}_{variant}.webp',
+                        render_variant(image, size)
+                    )
+        Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+            image_variants=variants)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', image_name)
+    finally:
+        connection.close()
+
+
+def schedule_variants(recipe):
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: executor.submit(build_variants, recipe_id, image_name))
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.similarity import build_arrays, prune_changes, save_arrays
+
+
+class Command(BaseCommand):
+    help = ('Строит матрицу похожести рецептов и сохраняет ее снимок, '
+            'который воркеры загружают через memory-mapping, и удаляет '
+            'устаревшие записи журнала изменений')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.SIMILARITY_INDEX_DIR)
+
+    def handle(self, *args, **options):
+        arrays = build_arrays()
+        save_arrays(arrays, options['path'])
+        self.stdout.write(
+            f"Рецептов: {len(arrays['ids'])}, "
+            f"связей: {len(arrays['row_indices'])}, "
+            f'удалено записей журнала: {prune_changes()}'
+        )
@@ -0,0 +1,68 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from recipes.models import Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = 'Выгружает рецепты с ингредиентами и тегами в формате JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='файл для выгрузки, по умолчанию stdout')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def get_batches(self, batch_size):
+        queryset = Recipe.objects.order_by('pk').select_related(
+            'author').prefetch_related(
+            'tags',
+            Prefetch('recipe_ingredients',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient'))
+        )
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def serialize(self, recipe):
+        return {
+            'name': recipe.name,
+            'author': recipe.author.email,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'image': recipe.image.name if recipe.image else None,
+            'tags': [tag.slug for tag in recipe.tags.all()],
+            'ingredients': [
+                {
+                    'name': recipe_ingredient.ingredient.name,
+                    'measurement_unit':
+                        recipe_ingredient.ingredient.measurement_unit,
+                    'amount': recipe_ingredient.amount,
+                }
+                for recipe_ingredient in recipe.recipe_ingredients.all()
+            ],
+        }
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file = (sys.stdout if path == '-'
+                else open(path, 'w', encoding='utf-8'))
+        exported = 0
+        try:
+            for batch in self.get_batches(options['batch_size']):
+                for recipe in batch:
+                    file.write(json.dumps(self.serialize(recipe),
+                                          ensure_ascii=False) + '\n')
+                exported += len(batch)
+        finally:
+            if file is not sys.stdout:
+                file.close()
+        self.stderr.write(f'Выгружено рецептов: {exported}')
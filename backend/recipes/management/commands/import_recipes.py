@@ -0,0 +1,160 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import json
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+
+from recipes.images import schedule_variants
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            Tag)
+from recipes.utils import bulk_create
+
+
+User = get_user_model()
+
+
+def copy_image(images_dir, name):
+    with open(os.path.join(images_dir, name), 'rb') as file:
+        return default_storage.save(name, File(file))
+
+
+class Command(BaseCommand):
+    help = 'Загружает рецепты из файла JSON Lines, созданного export_recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--images-dir',
+                            help='каталог с файлами картинок из выгрузки')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='потоки для копирования картинок')
+
+    def read(self, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as error:
+                    raise CommandError(f'Строка {number}: {error}')
+
+    def load_lookups(self):
+        self.authors = dict(User.objects.values_list('email', 'id'))
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = dict(Ingredient.objects.values_list('name', 'id'))
+
+    def resolve(self, record):
+        try:
+            return (
+                self.authors[record['author']],
+                [self.tags[slug] for slug in record['tags']],
+                [(self.ingredients[item['name']], item['amount'])
+                 for item in record['ingredients']],
+            )
+        except KeyError:
+            return None
+
+    def copy_images(self, records, pool):
+        names = [record.get('image') for record in records]
+        if pool is None:
+            return [None] * len(records)
+        return list(pool.map(
+            lambda name: copy_image(self.images_dir, name) if name else None,
+            names
+        ))
+
+    def resolve_batch(self, records):
+        existing = set(Recipe.objects.filter(
+            name__in=[record['name'] for record in records]
+        ).values_list('name', flat=True))
+        resolved = []
+        for record in records:
+            relations = self.resolve(record)
+            if record['name'] in existing or relations is None:
+                self.skipped += 1
+                continue
+            existing.add(record['name'])
+            resolved.append((record, relations))
+        return resolved
+
+    def import_batch(self, records, pool):
+        resolved = self.resolve_batch(records)
+        images = self.copy_images([record for record, _ in resolved], pool)
+        try:
+            self.save_batch(resolved, images)
+        except Exception:
+            for image in images:
+                if image:
+                    default_storage.delete(image)
+            raise
+
+    @transaction.atomic
+    def save_batch(self, resolved, images):
+        recipes = bulk_create(Recipe, (
+            Recipe(name=record['name'], author_id=author_id,
+                   text=record['text'], cooking_time=record['cooking_time'],
+                   image=image)
+            for (record, (author_id, _, _)), image in zip(resolved, images)
+        ), 'name')
+        dated = []
+        for recipe, (record, _) in zip(recipes, resolved):
+            if record.get('pub_date'):
+                recipe.pub_date = parse_datetime(record['pub_date'])
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ('pub_date',))
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag_id=tag_id)
+            for recipe, (_, (_, tag_ids, _)) in zip(recipes, resolved)
+            for tag_id in tag_ids
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for recipe, (_, (_, _, items)) in zip(recipes, resolved)
+            for ingredient_id, amount in items
+        )
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in recipes]).update_search_vector()
+        authors = Counter(recipe.author_id for recipe in recipes)
+        for author_id, count in authors.items():
+            User.objects.filter(pk=author_id).update(
+                recipes_count=F('recipes_count') + count)
+        for recipe in recipes:
+            if recipe.image:
+                schedule_variants(recipe)
+        self.imported += len(recipes)
+
+    def handle(self, *args, **options):
+        self.images_dir = options['images_dir']
+        self.imported = self.skipped = 0
+        self.load_lookups()
+        records = self.read(options['path'])
+        start = time.perf_counter()
+        pool = (ThreadPoolExecutor(max_workers=options['workers'])
+                if self.images_dir else None)
+        try:
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                self.import_batch(batch, pool)
+        except OSError as error:
+            raise CommandError(str(error))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {self.imported}, '
+            f'пропущено: {self.skipped} за {elapsed:.2f} с.'
+        ))
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Cart, Favorite, Recipe
+from users.models import Follow
+
+
+User = get_user_model()
+
+
+def count_subquery(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики избранного, корзин, рецептов и подписчиков'
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        recipes = Recipe.objects.update(
+            favorites_count=count_subquery(Favorite, 'recipe'),
+            carts_count=count_subquery(Cart, 'recipe'),
+        )
+        users = User.objects.update(
+            recipes_count=count_subquery(Recipe, 'author'),
+            followers_count=count_subquery(Follow, 'following'),
+        )
+        self.stdout.write(
+            f'Обновлено рецептов: {recipes}, пользователей: {users}')
@@ -1,22 +1,152 @@
 import csv
+import json
+import time
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import bump_version
+from foodgram_backend.constants import MEASURMENT_MAX_LEN, NAME_MAX_LENGTH
 from recipes.models import Ingredient
 
 
+DEFAULT_PATH = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+FORMATS = ('csv', 'json', 'jsonl')
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+        else:
+            yield None, None
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            yield parse_object(json.loads(line))
+
+
+def read_json(file):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer += chunk
+        if not started:
+            buffer = buffer.lstrip()
+            if buffer:
+                if buffer[0] != '[':
+                    raise CommandError('Ожидался JSON-массив объектов.')
+                buffer = buffer[1:]
+                started = True
+        while started:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if not buffer or buffer[0] == ']':
+                break
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break
+            yield parse_object(obj)
+            buffer = buffer[end:]
+        if not chunk:
+            if buffer.strip() not in ('', ']'):
+                raise CommandError('Некорректный JSON.')
+            return
+
+
+def parse_object(obj):
+    if not isinstance(obj, dict):
+        return None, None
+    return obj.get('name'), obj.get('measurement_unit')
+
+
+READERS = {'csv': read_csv, 'json': read_json, 'jsonl': read_jsonl}
+
+
 class Command(BaseCommand):
+    help = 'Загружает и обновляет ингредиенты из файла CSV, JSON или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_PATH))
+        parser.add_argument('--format', choices=FORMATS,
+                            help='по умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def get_format(self, path, file_format):
+        if file_format:
+            return file_format
+        extension = path.rsplit('.', 1)[-1].lower()
+        if extension not in FORMATS:
+            raise CommandError(
+                f'Не удалось определить формат файла {path}.')
+        return extension
+
+    def is_valid(self, name, measurement_unit):
+        return (isinstance(name, str) and isinstance(measurement_unit, str)
+                and 0 < len(name) <= NAME_MAX_LENGTH
+                and 0 < len(measurement_unit) <= MEASURMENT_MAX_LEN)
+
+    def batches(self, rows, batch_size):
+        batch = {}
+        for name, measurement_unit in rows:
+            if isinstance(name, str) and isinstance(measurement_unit, str):
+                name, measurement_unit = (name.strip(),
+                                          measurement_unit.strip())
+            if not self.is_valid(name, measurement_unit) or name in batch:
+                self.skipped += 1
+                continue
+            batch[name] = measurement_unit
+            if len(batch) >= batch_size:
+                yield batch
+                batch = {}
+        if batch:
+            yield batch
+
+    @transaction.atomic
+    def upsert(self, batch):
+        existing = Ingredient.objects.in_bulk(list(batch), field_name='name')
+        changed = []
+        for name, ingredient in existing.items():
+            if ingredient.measurement_unit != batch[name]:
+                ingredient.measurement_unit = batch[name]
+                changed.append(ingredient)
+        Ingredient.objects.bulk_update(changed, ('measurement_unit',))
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in batch.items()
+             if name not in existing),
+            ignore_conflicts=True
+        )
+        self.inserted += len(batch) - len(existing)
+        self.updated += len(changed)
+        self.skipped += len(existing) - len(changed)
 
-    def ingredients(self, csv_reader):
-        if not Ingredient.objects.exists():
-            ingredients_for_create = [
-                Ingredient(name=row[0], measurement_unit=row[1])
-                for row in csv_reader
-            ]
-            Ingredient.objects.bulk_create(ingredients_for_create)
-
-    def handle(self, *args, **kwargs):
-        csv_file_path = '../data/ingredients.csv'
-        with open(csv_file_path, 'r', encoding="utf-8") as file:
-            reader = csv.reader(file)
-            self.ingredients(reader)
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS[self.get_format(path, options['format'])]
+        self.inserted = self.updated = self.skipped = 0
+        start = time.perf_counter()
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                for batch in self.batches(reader(file),
+                                          options['batch_size']):
+                    self.upsert(batch)
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        except json.JSONDecodeError as error:
+            raise CommandError(f'Некорректный JSON в {path}: {error}')
+        elapsed = time.perf_counter() - start
+        bump_version(Ingredient._meta.label_lower)
+        total = self.inserted + self.updated + self.skipped
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {self.inserted}, обновлено: {self.updated}, '
+            f'пропущено: {self.skipped}. '
+            f'{total} строк за {elapsed:.2f} с '
+            f'({total / elapsed if elapsed else total:.0f} строк/с).'
+        ))
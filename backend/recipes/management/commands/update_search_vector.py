@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковые векторы всех рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Заполнить только рецепты без поискового вектора'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['missing']:
+            recipes = recipes.filter(search_vector__isnull=True)
+        updated = recipes.update_search_vector()
+        self.stdout.write(f'Обновлено рецептов: {updated}')
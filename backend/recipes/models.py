@@ -1,6 +1,11 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import F, Sum, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 
 from foodgram_backend import constants
 
@@ -39,6 +44,42 @@ class Tag(CommonInfo):
         verbose_name_plural = 'Теги'
 
 
+class SearchVectorIndex(GinIndex):
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return models.Index.create_sql(self, model, schema_editor,
+                                           using=using, **kwargs)
+        return super().create_sql(model, schema_editor, using=using,
+                                  **kwargs)
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def top_by_author(self, author_ids, limit=None):
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is None:
+            return queryset
+        ranked = queryset.annotate(recipe_rank=Window(
+            RowNumber(), partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('name').asc())
+        )).values('id', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT id FROM ({sql}) AS ranked WHERE recipe_rank <= %s',
+            (*params, limit)
+        ))
+
+    def update_search_vector(self):
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=constants.SEARCH_CONFIG)
+            + SearchVector('text', weight='B',
+                           config=constants.SEARCH_CONFIG)
+        ))
+
+
 class Recipe(CommonInfo):
     tags = models.ManyToManyField(Tag, through='RecipeTag', verbose_name='Тег')
     author = models.ForeignKey(User, on_delete=models.CASCADE,
@@ -54,16 +95,49 @@ class Recipe(CommonInfo):
     )
     image = models.ImageField('Картинка', upload_to='recipes/images/',
                               null=True, default=None)
+    image_variants = models.JSONField('Варианты картинки', default=dict,
+                                      editable=False)
     pub_date = models.DateTimeField('Дата и время публикации',
                                     auto_now_add=True)
+    updated_at = models.DateTimeField('Дата и время изменения',
+                                      auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    favorites_count = models.PositiveIntegerField(
+        'Количество добавлений в избранное', default=0, editable=False)
+    carts_count = models.PositiveIntegerField(
+        'Количество добавлений в список покупок', default=0, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta(CommonInfo.Meta):
         ordering = ('-pub_date', 'name')
         default_related_name = 'recipes'
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+            SearchVectorIndex(fields=('search_vector',),
+                              name='recipe_search_vector_idx'),
+        )
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
 
 
+class RecipeChange(models.Model):
+    """Журнал изменений рецептов для индексов в памяти воркеров."""
+
+    recipe_id = models.BigIntegerField('Рецепт')
+    created = models.DateTimeField('Время изменения', auto_now_add=True,
+                                   db_index=True)
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = 'изменение рецепта'
+        verbose_name_plural = 'Изменения рецептов'
+
+    def __str__(self):
+        return f'Изменение рецепта {self.recipe_id}'
+
+
 class RecipeTag(models.Model):
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, verbose_name='Рецепт',
@@ -82,11 +156,23 @@ class RecipeTag(models.Model):
             models.UniqueConstraint(fields=('recipe', 'tag'),
                                     name='unique_tag')
         ]
+        indexes = (
+            models.Index(fields=('tag', 'recipe'),
+                         name='recipetag_tag_recipe_idx'),
+        )
 
     def __str__(self):
         return f'У рецепта {self.recipe.name} тег {self.tag.name}'
 
 
+class RecipeIngredientQuerySet(models.QuerySet):
+
+    def shopping_list(self, user):
+        return self.filter(recipe__cart__user=user).values(
+            'ingredient_id', 'ingredient__name', 'ingredient__measurement_unit'
+        ).annotate(total_amount=Sum('amount')).order_by('ingredient__name')
+
+
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, verbose_name='Рецепт',
@@ -103,6 +189,8 @@ class RecipeIngredient(models.Model):
         )
     )
 
+    objects = RecipeIngredientQuerySet.as_manager()
+
     class Meta:
         ordering = ('recipe', 'ingredient')
         verbose_name = 'ингридиенты в рецепте'
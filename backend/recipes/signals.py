@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.images import schedule_variants
+from recipes.models import Cart, Favorite, Recipe
+from users.models import Follow
+
+
+User = get_user_model()
+
+COUNTERS = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    Cart: (Recipe, 'recipe_id', 'carts_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Follow: (User, 'following_id', 'followers_count'),
+}
+
+
+def change_counter(instance, delta):
+    model, attr, field = COUNTERS[type(instance)]
+    model.objects.filter(pk=getattr(instance, attr)).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_variants(sender, instance, **kwargs):
+    if (instance.image
+            and instance.image_variants.get('source') != instance.image.name):
+        schedule_variants(instance)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def increment_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counter(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Cart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def decrement_counter(sender, instance, **kwargs):
+    change_counter(instance, -1)
@@ -0,0 +1,196 @@
+from collections import Counter
+from io import StringIO
+import os
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from rest_framework.test import APITestCase
+
+from recipes.management.commands.import_recipes import (
+    Command as ImportRecipesCommand)
+from recipes.models import (Cart, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, Tag)
+
+
+User = get_user_model()
+
+
+class ShoppingListTest(TestCase):
+    recipes_in_cart = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, other = (
+            User.objects.create(username=name, email=f'{name}@example.com')
+            for name in ('buyer', 'other')
+        )
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(20)
+        ]
+        recipes = [
+            Recipe.objects.create(name=f'Рецепт {number}', author=other,
+                                  text='Описание', cooking_time=10)
+            for number in range(cls.recipes_in_cart + 1)
+        ]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredients[(number + shift) % len(ingredients)],
+                amount=number % 7 + shift + 1
+            )
+            for number, recipe in enumerate(recipes) for shift in range(3)
+        )
+        Cart.objects.bulk_create(
+            Cart(user=cls.user, recipe=recipe)
+            for recipe in recipes[:cls.recipes_in_cart]
+        )
+        Cart.objects.create(user=other, recipe=recipes[-1])
+        cls.expected = Counter()
+        for recipe_ingredient in RecipeIngredient.objects.filter(
+                recipe__in=recipes[:cls.recipes_in_cart]).select_related(
+                    'ingredient'):
+            cls.expected[recipe_ingredient.ingredient.name] += (
+                recipe_ingredient.amount)
+
+    def test_amounts_are_summed_per_ingredient(self):
+        with self.assertNumQueries(1):
+            items = list(RecipeIngredient.objects.shopping_list(self.user))
+        self.assertEqual(
+            {item['ingredient__name']: item['total_amount'] for item in items},
+            dict(self.expected)
+        )
+        self.assertEqual(
+            [item['ingredient__name'] for item in items],
+            sorted(self.expected)
+        )
+
+    def test_other_carts_are_excluded(self):
+        other = User.objects.get(username='other')
+        items = RecipeIngredient.objects.shopping_list(other)
+        self.assertEqual(len(items), 3)
+
+    def test_query_plan_uses_indexes(self):
+        queryset = RecipeIngredient.objects.shopping_list(self.user)
+        self.assertIn('GROUP BY', str(queryset.query))
+        plan = queryset.explain()
+        if connection.vendor == 'sqlite':
+            self.assertNotIn(' SCAN ', f' {plan}')
+        elif connection.vendor == 'postgresql':
+            self.assertIn('Aggregate', plan)
+
+
+class RunImportTest(APITestCase):
+    url = '/api/ingredients/'
+
+    def setUp(self):
+        cache.clear()
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+
+    def run_import(self, content):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                         encoding='utf-8') as file:
+            file.write(content)
+            file.flush()
+            call_command('run_import', file.name, stdout=StringIO())
+
+    def test_import_invalidates_cached_ingredients(self):
+        self.assertEqual(len(self.client.get(self.url).data), 1)
+        self.run_import('Соль,кг\nСахар,г\n')
+        response = self.client.get(self.url)
+        self.assertEqual(
+            [(item['name'], item['measurement_unit'])
+             for item in response.data],
+            [('Сахар', 'г'), ('Соль', 'кг')]
+        )
+        self.assertEqual(
+            [item['name']
+             for item in self.client.get(self.url, {'name': 'са'}).data],
+            ['Сахар']
+        )
+
+    def test_version_is_visible_to_other_processes(self):
+        name = f'version:{Ingredient._meta.label_lower}'
+        self.run_import('Сахар,г\n')
+        self.assertIsNotNone(caches['versions'].get(name))
+        if not settings.SHARED_CACHE:
+            self.assertIsNone(cache.get(name))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ExportImportRecipesTest(TestCase):
+    image = 'recipes/images/export.png'
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author',
+                                     email='author@example.com')
+        tags = [Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+                for number in range(2)]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(3)
+        ]
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', author=author, text='Описание',
+                cooking_time=10 + number,
+                image=cls.image if number == 0 else None)
+            RecipeTag.objects.create(recipe=recipe, tag=tags[number % 2])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in ingredients[number:]
+            )
+
+    def setUp(self):
+        self.images_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.images_dir, 'recipes/images'))
+        with open(os.path.join(self.images_dir, self.image), 'wb') as file:
+            file.write(b'image')
+        self.path = os.path.join(self.images_dir, 'recipes.jsonl')
+        call_command('export_recipes', self.path, stderr=StringIO())
+
+    def get_recipes(self):
+        return {
+            recipe.name: (
+                recipe.author.email, recipe.text, recipe.cooking_time,
+                recipe.pub_date,
+                {tag.slug for tag in recipe.tags.all()},
+                {(item.ingredient.name, item.amount)
+                 for item in recipe.recipe_ingredients.all()},
+            )
+            for recipe in Recipe.objects.select_related('author')
+        }
+
+    def import_recipes(self):
+        call_command('import_recipes', self.path, batch_size=2,
+                     images_dir=self.images_dir, stdout=StringIO())
+
+    def test_round_trip(self):
+        exported = self.get_recipes()
+        Recipe.objects.all().delete()
+        self.import_recipes()
+        self.assertEqual(self.get_recipes(), exported)
+        image = Recipe.objects.get(name='Рецепт 0').image
+        with default_storage.open(image.name) as file:
+            self.assertEqual(file.read(), b'image')
+        self.import_recipes()
+        self.assertEqual(Recipe.objects.count(), 3)
+
+    def test_failed_batch_removes_copied_images(self):
+        Recipe.objects.all().delete()
+        with mock.patch.object(ImportRecipesCommand, 'save_batch',
+                               side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.import_recipes()
+        self.assertFalse(default_storage.listdir('recipes/images')[1])
@@ -0,0 +1,17 @@
+from django.db import connection
+
+
+def bulk_create(model, objects, field):
+    """Создает объекты и заполняет их pk по уникальному полю field.
+
+    SQLite в Django 3.2 не возвращает pk из bulk_create, поэтому они
+    перечитываются отдельным запросом.
+    """
+    objects = model.objects.bulk_create(objects)
+    if not connection.features.can_return_rows_from_bulk_insert:
+        pks = dict(model.objects.filter(**{
+            f'{field}__in': [getattr(obj, field) for obj in objects]
+        }).values_list(field, 'pk'))
+        for obj in objects:
+            obj.pk = pks[getattr(obj, field)]
+    return objects
@@ -22,6 +22,12 @@ class User(AbstractUser):
                                  max_length=constants.LAST_NAME_MAX_LEN)
     avatar = models.ImageField('Аватар', upload_to='users/',
                                blank=True, default=None)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False)
+    updated_at = models.DateTimeField('Дата и время изменения',
+                                      auto_now=True)
 
     class Meta(AbstractUser.Meta):
         ordering = ('username', 'last_name', 'id')